@@ -1,21 +1,41 @@
 import logging
-from secret_manager import get_secret
+from secret_manager import get_secret, prefetch_secrets
 
 # このモジュール用のロガーをセットアップ
 config_logger = logging.getLogger(__name__)
 
-# --- LINE WORKS Bot 設定 (署名検証に必要) ---
-LINEWORKS_BOT_SECRET = get_secret('LINEWORKS_BOT_SECRET', logger=config_logger)
+# --- シークレットとして管理する設定値 ---
+# これらはモジュール属性として初めて参照された時点で取得する（PEP 562 の __getattr__ を使用）
+_SECRET_NAMES = frozenset({
+    # --- LINE WORKS Bot 設定 (署名検証に必要) ---
+    'LINEWORKS_BOT_SECRET',
+    # --- Google Cloud 設定 ---
+    'GCP_PROJECT_ID',
+    'GCP_LOCATION',
+    'CLOUD_TASKS_QUEUE_ID',
+    # --- ワーカーサービス設定 ---
+    # ワーカーサービスのCloud Run URL
+    'WORKER_URL',
+    # --- サービスアカウント設定 (OIDCトークン作成に必要) ---
+    # Cloud Tasksがワーカーサービスを呼び出す際に使用するサービスアカウントのメールアドレス
+    'GCP_SERVICE_ACCOUNT_EMAIL',
+})
 
-# --- Google Cloud 設定 ---
-GCP_PROJECT_ID = get_secret('GCP_PROJECT_ID', logger=config_logger)
-GCP_LOCATION = get_secret('GCP_LOCATION', logger=config_logger)
-CLOUD_TASKS_QUEUE_ID = get_secret('CLOUD_TASKS_QUEUE_ID', logger=config_logger)
+# --- シークレットの一括取得 ---
+# 起動時にSecret Managerへのアクセスを並列化し、以降のget_secret呼び出しをキャッシュから返す
+# 取得に失敗したものは、属性の初回参照時に改めて個別に取得される
+# （再取得が効くよう、利用側はインポート時に値を固定せず、使用時に参照すること）
+prefetch_secrets(sorted(_SECRET_NAMES), logger=config_logger)
 
-# --- ワーカーサービス設定 ---
-# ワーカーサービスのCloud Run URL
-WORKER_URL = get_secret('WORKER_URL', logger=config_logger)
-
-# --- サービスアカウント設定 (OIDCトークン作成に必要) ---
-# Cloud Tasksがワーカーサービスを呼び出す際に使用するサービスアカウントのメールアドレス
-GCP_SERVICE_ACCOUNT_EMAIL = get_secret('GCP_SERVICE_ACCOUNT_EMAIL', logger=config_logger)
\ No newline at end of file
+def __getattr__(name):
+    """
+    シークレット由来の設定値を遅延取得する。
+    取得に成功した値はモジュールのグローバルに格納し、以降は通常の属性参照で返す。
+    """
+    if name in _SECRET_NAMES:
+        value = get_secret(name, logger=config_logger)
+        # 取得に失敗した場合（None）は格納せず、次回の参照時に再取得する
+        if value is not None:
+            globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,11 +1,35 @@
 import base64
-import hashlib
+import binascii
 import hmac
 import logging
+import os
 
 # 独自のモジュールをインポート
 import config
 
+# 署名検証用の鍵バイト列（初回の取得成功時に生成し、以降は使い回す）
+_secret_key_bytes = None
+
+# 署名比較用のブラインド鍵（プロセスごとにランダム生成）
+# 比較前に両ダイジェストをこの鍵で再度HMAC化し、攻撃者が比較対象のバイト列を操作できないようにする
+_BLIND_KEY = os.urandom(32)
+
+def _get_secret_key_bytes():
+    """
+    Bot Secretを鍵バイト列として返す。
+    取得に失敗した場合（None）はキャッシュせず、次回の呼び出し時に再取得する。
+    """
+    global _secret_key_bytes
+    if _secret_key_bytes is None:
+        bot_secret = config.LINEWORKS_BOT_SECRET
+        if bot_secret:
+            _secret_key_bytes = bot_secret.encode('utf-8')
+    return _secret_key_bytes
+
+def _blind(digest):
+    """ブラインド鍵でダイジェストを再HMAC化する（double-HMAC）。"""
+    return hmac.digest(_BLIND_KEY, digest, 'sha256')
+
 def verify_signature(signature_header, request_body):
     """
     LINE WORKSからのコールバックリクエストの署名を検証する。
@@ -16,23 +40,28 @@ def verify_signature(signature_header, request_body):
         logging.error("エラー: X-WORKS-Signature ヘッダーが見つかりません。")
         return False
 
+    # Bot Secretが取得できていない場合は検証できない
+    secret_key_bytes = _get_secret_key_bytes()
+    if secret_key_bytes is None:
+        logging.error("エラー: LINEWORKS_BOT_SECRET が設定されていないため、署名を検証できません。")
+        return False
+
+    # Bot Secretを秘密鍵として使用し、リクエストボディをHMAC-SHA256でハッシュ化
+    # request_bodyは既にbytes形式
+    # hmac.digest は HMAC オブジェクトを生成せず OpenSSL の高速パスで直接計算する
+    digest = hmac.digest(secret_key_bytes, request_body, 'sha256')
+
+    # 受信した署名をBase64デコードし、生のダイジェスト同士を比較する
+    # 不正な形式の署名もHMAC計算後に判定し、処理時間を揃える
     try:
-        # Bot Secretを秘密鍵として使用し、リクエストボディをHMAC-SHA256でハッシュ化
-        secret_key_bytes = config.LINEWORKS_BOT_SECRET.encode('utf-8')
-        body_bytes = request_body # request_bodyは既にbytes形式
-        
-        hash_obj = hmac.new(secret_key_bytes, body_bytes, hashlib.sha256).digest()
-        
-        # ハッシュ化した結果をBase64エンコード
-        calculated_signature = base64.b64encode(hash_obj)
-
-        # 受信した署名と計算した署名が一致するかどうかを比較
-
-        if hmac.compare_digest(calculated_signature, signature_header.encode('utf-8')):
-            return True
-        else:
-            logging.error("エラー: 署名が一致しません！")
-            return False
-    except Exception as e:
-        logging.error("エラー: 署名検証中に例外が発生しました: {e}")
-        return False
\ No newline at end of file
+        received_digest = base64.b64decode(signature_header, validate=True)
+    except (binascii.Error, ValueError):
+        logging.error("エラー: 署名の形式が不正です！")
+        return False
+
+    # double-HMAC: 比較する値をブラインド化し、compare_digest の実装に依存せず比較時間を入力から独立させる
+    if hmac.compare_digest(_blind(digest), _blind(received_digest)):
+        return True
+
+    logging.error("エラー: 署名が一致しません！")
+    return False
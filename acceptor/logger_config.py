@@ -12,10 +12,27 @@ class CloudTraceFilter(logging.Filter):
     """
     ログレコードに、Google Cloud Loggingがネイティブに認識する
     'trace'フィールドと、検索用の'traceId'フィールドを追加するフィルター。
+    プロジェクトIDは生成時に受け取る（config の値はシークレットとして遅延取得され、
+    取得時のログ出力がこのフィルターを再帰的に呼び出さないようにするため）。
+    起動時に取得できなかった場合は、他の処理で取得済みになった値を後から拾う。
     """
+    def __init__(self, project_id: str):
+        super().__init__()
+        self.project_id = project_id
+
+    def _resolve_project_id(self):
+        """
+        プロジェクトIDを返す。未取得の場合は config のグローバルに格納済みの値を参照する。
+        （vars() 経由の参照は __getattr__ を経由しないため、シークレットの取得やログ出力は発生しない）
+        """
+        if self.project_id is None:
+            self.project_id = vars(config).get('GCP_PROJECT_ID')
+        return self.project_id
+
     def filter(self, record):
         trace_id = trace_id_var.get()
-        record.trace = f"projects/{config.GCP_PROJECT_ID}/traces/{trace_id}"
+        # ワーカーのログ・traceparent ヘッダーと同じ形式（ハイフンなしの16進数32桁）に揃える
+        record.trace = f"projects/{self._resolve_project_id()}/traces/{trace_id.replace('-', '')}"
         
         # jsonPayloadに独立したフィールドとして追加
         record.json_fields = {
@@ -34,7 +51,7 @@ def configure_logging():
     handler = CloudLoggingHandler(client, name="bot-ocr-acceptor")
 
     # フィルターをハンドラに追加
-    handler.addFilter(CloudTraceFilter())
+    handler.addFilter(CloudTraceFilter(config.GCP_PROJECT_ID))
     
     # ハンドラをロガーに設定
     setup_logging(handler)
@@ -1,10 +1,16 @@
 # acceptor/main.py
 
 import os
-import json
+import re
 import uuid
 import logging
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from flask import Flask, request, abort
+from google.api_core import exceptions
+from google.api_core import retry as retries
 from google.cloud import tasks_v2
 from context import trace_id_var
 
@@ -18,8 +24,112 @@ logger_config.configure_logging()
 
 app = Flask(__name__)
 
-# Cloud Tasks クライアントを初期化
-tasks_client = tasks_v2.CloudTasksClient()
+# Cloud Tasks クライアントのインスタンス（遅延初期化用）
+_tasks_client = None
+# スレッドプールの複数スレッドから同時に初回呼び出しされても、クライアントを一度だけ生成するためのロック
+_tasks_client_lock = threading.Lock()
+
+# Cloud Task作成用のスレッドプール
+# create_task はCloud TasksへのRTT分だけ同期的にブロックするため、バックグラウンドで実行し
+# LINE WORKSへの200 OKは完了を待たずに返す
+# （レスポンス後もCPUが割り当てられるよう、infra/services.tf で cpu_idle = false としている）
+_TASK_EXECUTOR_MAX_WORKERS = 16
+_task_executor = ThreadPoolExecutor(max_workers=_TASK_EXECUTOR_MAX_WORKERS, thread_name_prefix="create-task")
+
+# create_task のリトライ設定（指数バックオフ + ジッター）
+# 一時的な障害で作成に失敗すると、LINE WORKSには200を返却済みのためアップロードが失われる
+_CREATE_TASK_RETRY = retries.Retry(
+    predicate=retries.if_exception_type(
+        exceptions.ServiceUnavailable,
+        exceptions.DeadlineExceeded,
+        exceptions.InternalServerError,
+        exceptions.TooManyRequests,
+    ),
+    initial=0.1, # 秒
+    maximum=2.0, # 秒
+    multiplier=2.0,
+    timeout=30.0, # 秒（リトライ全体の上限）
+)
+# create_task 1回あたりのタイムアウト（秒）
+_CREATE_TASK_TIMEOUT = 10.0
+
+# キューのパスと、リクエストごとに変化しないHTTPリクエスト部分のテンプレート（bodyのみ毎回差し替える）
+# 設定値はSecret Managerから遅延取得されるため、初回の組み立て成功時にキャッシュする
+_queue_path = None
+_http_request_template = None
+
+# イベントが "type": "message" を含むかどうかを判定するパターン（空白の有無を許容）
+_MESSAGE_TYPE_PATTERN = re.compile(rb'"type"\s*:\s*"message"')
+
+def _get_tasks_client():
+    """
+    CloudTasksClientのシングルトンを取得する。
+    初回呼び出し時のみ初期化を行う（遅延ロード）。
+    """
+    global _tasks_client
+    if _tasks_client is None:
+        with _tasks_client_lock:
+            # ロック取得待ちの間に他スレッドが初期化済みの場合は、そのインスタンスを使う
+            if _tasks_client is None:
+                _tasks_client = tasks_v2.CloudTasksClient()
+    return _tasks_client
+
+def _get_queue_path():
+    """
+    Cloud Tasksのキューのパスを取得する。
+    設定値が揃っていない場合はキャッシュせずに例外を送出し、次回の呼び出し時に再度組み立てる。
+    """
+    global _queue_path
+    if _queue_path is None:
+        project_id = config.GCP_PROJECT_ID
+        location = config.GCP_LOCATION
+        queue_id = config.CLOUD_TASKS_QUEUE_ID
+        if not (project_id and location and queue_id):
+            raise RuntimeError("GCP_PROJECT_ID / GCP_LOCATION / CLOUD_TASKS_QUEUE_ID が取得できないため、キューのパスを組み立てられません。")
+        # queue_path は静的メソッドなので、クライアントの生成は不要
+        _queue_path = tasks_v2.CloudTasksClient.queue_path(project_id, location, queue_id)
+    return _queue_path
+
+def _get_http_request_template():
+    """
+    Cloud Taskに設定するHTTPリクエストのテンプレートを取得する。
+    設定値が揃っていない場合はキャッシュせずに例外を送出し、次回の呼び出し時に再度組み立てる。
+    """
+    global _http_request_template
+    if _http_request_template is None:
+        worker_url = config.WORKER_URL
+        service_account_email = config.GCP_SERVICE_ACCOUNT_EMAIL
+        if not (worker_url and service_account_email):
+            raise RuntimeError("WORKER_URL / GCP_SERVICE_ACCOUNT_EMAIL が取得できないため、Cloud Taskを作成できません。")
+        _http_request_template = {
+            "http_method": tasks_v2.HttpMethod.POST,
+            "url": worker_url,
+            "headers": {"Content-Type": "application/json"},
+            "oidc_token": {"service_account_email": service_account_email}
+        }
+    return _http_request_template
+
+def _create_task(task, trace_id):
+    """
+    Cloud Taskを作成する（スレッドプール上で実行される）。
+    一時的なエラーの場合は、_CREATE_TASK_RETRY に従ってリトライする。
+    """
+    _get_tasks_client().create_task(
+        parent=_get_queue_path(),
+        task=task,
+        retry=_CREATE_TASK_RETRY,
+        timeout=_CREATE_TASK_TIMEOUT,
+    )
+    logging.info(f"Cloud Task作成成功: trace_id={trace_id}")
+
+def _on_create_task_done(future):
+    """
+    Cloud Task作成の完了コールバック。失敗した場合にログを記録する。
+    """
+    exc = future.exception()
+    if exc is not None:
+        # 5. Cloud Task作成失敗時のエラーハンドリング
+        logging.critical("重大なエラー: Cloud Taskの作成中に例外が発生しました。", exc_info=exc)
 
 @app.route("/callback", methods=['POST'])
 def callback():
@@ -29,32 +139,40 @@ def callback():
     構造化ロギングとtrace_idを使用する。
     """
     # リクエストごとにユニークなtrace_idを生成
-    trace_id = str(uuid.uuid4())
+    # Cloud Trace・traceparentヘッダーの trace-id と同じ形式（ハイフンなしの16進数32桁）で生成する
+    trace_id = uuid.uuid4().hex
     trace_id_var.set(trace_id)
 
-    # 0.受信したリクエストのヘッダーと生ボディをログに記録
-    # ヘッダーは辞書に変換して記録
-    request_headers = dict(request.headers)
-    # ボディはbytes形式なので、デコードして記録
-    request_body_str = request.get_data(as_text=True)
+    # 0.受信したリクエストのヘッダーと生ボディをDEBUGログに記録
+    # ボディは一度だけbytesとして読み込み、署名検証・JSON解析・ログ出力で共有する
+    request_body = request.get_data(cache=True)
 
-    logging.info({
-        "message": "Acceptorがコールバックリクエストを完全に受信しました。",
-        "headers": request_headers,
-        "raw_body": request_body_str
-    })
+    # 毎リクエストの全量ダンプは負荷が高いため、DEBUGが有効な場合のみ
+    # ヘッダーの辞書化やボディのデコードを行う
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug({
+            "message": "Acceptorがコールバックリクエストを完全に受信しました。",
+            "headers": dict(request.headers),
+            "raw_body": request_body.decode('utf-8', 'replace')
+        })
 
     # 1. 署名検証(LINE WORKSからの正当なリクエストであることを確認)
     signature_header = request.headers.get('X-WORKS-Signature')
-    request_body = request.get_data()
     if not lineworks_api.verify_signature(signature_header, request_body):
         logging.warning("署名検証失敗。リクエストを破棄します。")
         abort(401)
 
     # 2. リクエストボディをJSONとして解析
+    # メッセージ以外のイベントはJSON解析を行わずに破棄する（バイト列の検索のみで判定）
+    if b'"type"' in request_body and not _MESSAGE_TYPE_PATTERN.search(request_body):
+        logging.info("メッセージタイプ以外のイベントを受信。処理をスキップします。")
+        return "OK", 200
+
     try:
-        event_data = json.loads(request_body.decode('utf-8'))
-    except json.JSONDecodeError:
+        # orjson.loads はbytesを直接受け付けるため、事前のデコードは不要
+        # （不正なUTF-8もorjson.JSONDecodeErrorとして送出される）
+        event_data = orjson.loads(request_body)
+    except orjson.JSONDecodeError:
         logging.error("エラー: リクエストボディのJSON解析に失敗しました。")
         # JSON解析失敗時でもLINE WORKSには200を返す
         return "OK", 200
@@ -90,28 +208,30 @@ def callback():
                     'trace_id': trace_id 
                 }
                 
-                queue_path = tasks_client.queue_path(config.GCP_PROJECT_ID, config.GCP_LOCATION, config.CLOUD_TASKS_QUEUE_ID)
-                
+                # テンプレートは共有されるため、浅いコピーにbodyだけを追加する
                 task = {
                     "http_request": {
-                        "http_method": tasks_v2.HttpMethod.POST,
-                        "url": config.WORKER_URL,
-                        "headers": {"Content-Type": "application/json"},
-                        "body": json.dumps(task_payload).encode(),
-                        "oidc_token": {"service_account_email": config.GCP_SERVICE_ACCOUNT_EMAIL}
+                        **_get_http_request_template(),
+                        # orjson.dumps はbytesを直接返すため、encodeは不要
+                        "body": orjson.dumps(task_payload)
                     }
                 }
-                
-                tasks_client.create_task(parent=queue_path, task=task)
-                logging.info(f"Cloud Task作成成功: trace_id={trace_id}")
+
+                # 作成はスレッドプールに投げて完了を待たない
+                # trace_idをログに引き継ぐため、現在のコンテキストのコピー上で実行する
+                ctx = contextvars.copy_context()
+                future = _task_executor.submit(ctx.run, _create_task, task, trace_id)
+                future.add_done_callback(lambda f: ctx.copy().run(_on_create_task_done, f))
 
             except Exception as e:
                 # 5. Cloud Task作成失敗時のエラーハンドリング
-                logging.critical("重大なエラー: Cloud Taskの作成中に例外が発生しました。", exc_info=True)
+                logging.critical("重大なエラー: Cloud Taskの作成依頼中に例外が発生しました。", exc_info=True)
 
     # 6. LINE WORKSには常に200 OKを返す
     return "OK", 200
 
 if __name__ == '__main__':
+    # ローカル開発用の起動。本番はProcfileのgunicornから起動する
+    # デバッガとリローダーは FLASK_DEBUG=1 の場合のみ有効にする（debug未指定時はFlaskが環境変数を参照する）
     port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
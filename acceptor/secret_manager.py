@@ -1,7 +1,13 @@
 import os
 import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.api_core import exceptions
 from google.cloud import secretmanager
 
+from ttl_cache import TTLCache
+
 # クライアントを初期化
 client = secretmanager.SecretManagerServiceClient()
 
@@ -9,8 +15,9 @@ client = secretmanager.SecretManagerServiceClient()
 # 環境変数が設定されていない場合、gcloudのデフォルトプロジェクトが使用される
 project_id = os.environ.get('GCP_PROJECT_ID', 'sunny-resolver-460603-m3') 
 
-# 取得したシークレットをキャッシュするための辞書
-_secret_cache = {}
+# 取得したシークレットをキャッシュするためのTTL付きLRUキャッシュ
+# シークレットのローテーションに追従できるよう、一定時間で再取得する
+_secret_cache = TTLCache(maxsize=64, ttl=3600)
 
 # センシティブな情報のキーを定義（これらのキーの値はログに出力しない）
 SENSITIVE_KEYS = [
@@ -22,6 +29,63 @@ SENSITIVE_KEYS = [
     'AWS_SECRET_ACCESS_KEY'
 ]
 
+# 一括取得時の最大並列数
+_PREFETCH_MAX_WORKERS = 8
+
+# Secret Manager呼び出しのリトライ設定（指数バックオフ + ジッター）
+_RETRY_MAX_ATTEMPTS = 3
+_RETRY_BASE_DELAY = 0.1 # 秒
+_RETRY_MAX_DELAY = 2.0 # 秒
+# 一時的な障害とみなしてリトライするエラー
+_RETRYABLE_ERRORS = (
+    exceptions.ServiceUnavailable,
+    exceptions.DeadlineExceeded,
+    exceptions.InternalServerError,
+    exceptions.TooManyRequests,
+)
+
+def _call_with_retry(func, *args, **kwargs):
+    """
+    一時的なエラーが発生した場合に、指数バックオフ + ジッター(Full Jitter)で関数呼び出しをリトライする。
+    """
+    for attempt in range(1, _RETRY_MAX_ATTEMPTS + 1):
+        try:
+            return func(*args, **kwargs)
+        except _RETRYABLE_ERRORS:
+            if attempt == _RETRY_MAX_ATTEMPTS:
+                raise
+            time.sleep(random.uniform(0, min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** attempt)))
+
+def _fetch_secret(secret_id: str, version_id: str) -> str:
+    """
+    Secret Managerからシークレットの値を取得し、前後の空白や改行を削除して返す。
+    """
+    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
+    response = _call_with_retry(client.access_secret_version, request={"name": name})
+    return response.payload.data.decode("UTF-8").strip()
+
+def prefetch_secrets(secret_ids, logger: logging.Logger, version_id: str = "latest"):
+    """
+    複数のシークレットをSecret Managerから並列に取得し、キャッシュに格納する。
+    環境変数で設定済み、またはキャッシュ済みのシークレットはスキップする。
+    取得に失敗したシークレットは、後続のget_secret呼び出しで改めて取得される。
+    """
+    targets = [
+        secret_id for secret_id in secret_ids
+        if not os.environ.get(secret_id) and f"{secret_id}:{version_id}" not in _secret_cache
+    ]
+    if not targets:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(_PREFETCH_MAX_WORKERS, len(targets))) as executor:
+        futures = {executor.submit(_fetch_secret, secret_id, version_id): secret_id for secret_id in targets}
+        for future in as_completed(futures):
+            secret_id = futures[future]
+            try:
+                _secret_cache.set(f"{secret_id}:{version_id}", future.result())
+            except Exception as e:
+                logger.warning(f"Failed to prefetch secret: {secret_id}. Details: {e}")
+
 def get_secret(secret_id: str, logger: logging.Logger, version_id: str = "latest") -> str:
     """
     Secret Managerからシークレットの値を取得し、キャッシュし、ログを記録する関数。
@@ -45,9 +109,9 @@ def get_secret(secret_id: str, logger: logging.Logger, version_id: str = "latest
     cache_key = f"{secret_id}:{version_id}"
 
     # まずキャッシュを確認
-    if cache_key in _secret_cache:
+    cached_value = _secret_cache.get(cache_key)
+    if cached_value is not None:
         # キャッシュから値を返す場合も、それがセンシティブでないならログに記録
-        cached_value = _secret_cache[cache_key]
         log_payload = {
             "message": "Loaded secret from cache.",
             "secret_id": secret_id,
@@ -60,18 +124,12 @@ def get_secret(secret_id: str, logger: logging.Logger, version_id: str = "latest
         logger.info(log_payload)
         return cached_value
 
-    # シークレットの完全なリソース名を構築
-    name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-
     try:
         # シークレットバージョンにアクセス
-        response = client.access_secret_version(request={"name": name})
-        
-        # ペイロードをデコードし、前後の空白や改行を削除
-        payload = response.payload.data.decode("UTF-8").strip()
+        payload = _fetch_secret(secret_id, version_id)
         
         # 結果をキャッシュに保存
-        _secret_cache[cache_key] = payload
+        _secret_cache.set(cache_key, payload)
         
         # ログを記録
         log_payload = {
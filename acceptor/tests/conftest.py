@@ -0,0 +1,24 @@
+import os
+import sys
+from unittest.mock import MagicMock
+
+import pytest
+
+# acceptor ディレクトリをパスに追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# ============================================================================
+# 【重要】configのインポート前にsecret_managerをモックする
+# config.pyはシークレットの取得にget_secretを呼び出すため、インポート前にインターセプトが必要
+# conftest.py は各テストモジュールの収集（インポート）より先に読み込まれるため、ここでセッション全体に対して1回だけ差し替える
+# ============================================================================
+_mock_secret_manager_module = MagicMock()
+# get_secretがダミー値を返すように設定し、config.pyの初期化エラーを防ぐ
+_mock_secret_manager_module.get_secret.return_value = "dummy_secret_value"
+
+_session_monkeypatch = pytest.MonkeyPatch()
+_session_monkeypatch.setitem(sys.modules, 'secret_manager', _mock_secret_manager_module)
+
+def pytest_unconfigure(config):
+    """セッションの終了時に、差し替えたモジュールを元に戻す。"""
+    _session_monkeypatch.undo()
@@ -0,0 +1,39 @@
+import logging
+import unittest
+from unittest.mock import patch
+
+import config
+import logger_config
+from context import trace_id_var
+
+class TestCloudTraceFilter(unittest.TestCase):
+
+    def _make_record(self):
+        return logging.LogRecord("test", logging.INFO, __file__, 0, "message", None, None)
+
+    def test_trace_field(self):
+        """trace フィールドがプロジェクトIDとハイフンなしのtrace_idで組み立てられること"""
+        token = trace_id_var.set("0af7651916cd43dd-8448eb211c80319c")
+        self.addCleanup(trace_id_var.reset, token)
+
+        record = self._make_record()
+        self.assertTrue(logger_config.CloudTraceFilter("my-project").filter(record))
+        self.assertEqual(record.trace, "projects/my-project/traces/0af7651916cd43dd8448eb211c80319c")
+        self.assertEqual(record.json_fields, {"traceId": "0af7651916cd43dd-8448eb211c80319c"})
+
+    def test_missing_project_id_recovers(self):
+        """起動時にプロジェクトIDが未取得でも、config に格納された後はその値を使うこと"""
+        trace_filter = logger_config.CloudTraceFilter(None)
+        with patch.dict(vars(config)):
+            vars(config).pop('GCP_PROJECT_ID', None)
+            record = self._make_record()
+            trace_filter.filter(record)
+            self.assertTrue(record.trace.startswith("projects/None/"))
+
+            vars(config)['GCP_PROJECT_ID'] = "my-project"
+            record = self._make_record()
+            trace_filter.filter(record)
+            self.assertTrue(record.trace.startswith("projects/my-project/"))
+
+if __name__ == '__main__':
+    unittest.main()
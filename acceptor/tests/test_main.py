@@ -0,0 +1,90 @@
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from google.api_core import exceptions
+
+import logger_config
+
+# インポート時のロギング設定（Cloud Loggingハンドラの登録）は行わない
+with patch.object(logger_config, 'configure_logging'):
+    import main
+
+class TestCreateTask(unittest.TestCase):
+
+    def test_create_task_passes_retry_and_timeout(self):
+        """create_task にリトライ設定とタイムアウトが渡されること"""
+        mock_client = MagicMock()
+        with patch.object(main, '_get_tasks_client', return_value=mock_client):
+            main._create_task({"http_request": {}}, "trace")
+        kwargs = mock_client.create_task.call_args.kwargs
+        self.assertIs(kwargs['retry'], main._CREATE_TASK_RETRY)
+        self.assertEqual(kwargs['timeout'], main._CREATE_TASK_TIMEOUT)
+
+    def test_retry_only_transient_errors(self):
+        """一時的なエラーはリトライされ、それ以外のエラーは即座に送出されること"""
+        calls = []
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise exceptions.ServiceUnavailable("unavailable")
+            return "created"
+
+        with patch('time.sleep'):
+            self.assertEqual(main._CREATE_TASK_RETRY(flaky)(), "created")
+        self.assertEqual(len(calls), 2)
+
+        invalid = MagicMock(side_effect=exceptions.InvalidArgument("invalid"))
+        with self.assertRaises(exceptions.InvalidArgument):
+            main._CREATE_TASK_RETRY(invalid)()
+        invalid.assert_called_once()
+
+class TestTaskTarget(unittest.TestCase):
+
+    def setUp(self):
+        # 各テストの前にキャッシュを破棄し、config からの組み立て経路を通るようにする
+        for name in ('_queue_path', '_http_request_template'):
+            patcher = patch.object(main, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_missing_config_is_not_cached(self):
+        """設定値が取得できない間は例外となり、取得できるようになれば組み立てられること"""
+        with patch.object(main.config, 'GCP_PROJECT_ID', None):
+            with self.assertRaises(RuntimeError):
+                main._get_queue_path()
+        self.assertIsNone(main._queue_path)
+        self.assertEqual(
+            main._get_queue_path(),
+            "projects/dummy_secret_value/locations/dummy_secret_value/queues/dummy_secret_value",
+        )
+
+        with patch.object(main.config, 'WORKER_URL', None):
+            with self.assertRaises(RuntimeError):
+                main._get_http_request_template()
+        self.assertIsNone(main._http_request_template)
+        self.assertEqual(main._get_http_request_template()["url"], "dummy_secret_value")
+
+class TestGetTasksClient(unittest.TestCase):
+
+    def test_concurrent_first_use_creates_one_client(self):
+        """複数スレッドから同時に初回呼び出しされても、クライアントは一度だけ生成されること"""
+        barrier = threading.Barrier(8)
+        results = []
+        def worker():
+            barrier.wait()
+            results.append(main._get_tasks_client())
+
+        with patch.object(main, '_tasks_client', None), \
+             patch.object(main.tasks_v2, 'CloudTasksClient', side_effect=lambda: object()) as mock_cls:
+            threads = [threading.Thread(target=worker) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        mock_cls.assert_called_once()
+        self.assertEqual(len({id(c) for c in results}), 1)
+
+if __name__ == '__main__':
+    unittest.main()
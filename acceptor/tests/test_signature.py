@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import patch
+import base64
+import hashlib
+import hmac
+
+import config
+import lineworks_api
+
+def _sign(body: bytes, secret: str = "dummy_secret_value") -> str:
+    """LINE WORKSと同じ方式（HMAC-SHA256のBase64）で署名を生成する。"""
+    return base64.b64encode(hmac.new(secret.encode('utf-8'), body, hashlib.sha256).digest()).decode()
+
+class TestVerifySignature(unittest.TestCase):
+
+    def setUp(self):
+        # 各テストの前に鍵のキャッシュを破棄し、config からの取得経路を通るようにする
+        patcher = patch.object(lineworks_api, '_secret_key_bytes', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid_signature(self):
+        """Bot Secretで署名された本文は検証に成功すること"""
+        body = '{"type":"message","content":{"text":"こんにちは"}}'.encode('utf-8')
+        self.assertTrue(lineworks_api.verify_signature(_sign(body), body))
+
+    def test_tampered_body_or_wrong_secret(self):
+        """本文の改ざんや、異なる鍵による署名は検証に失敗すること"""
+        body = b'{"type":"message"}'
+        self.assertFalse(lineworks_api.verify_signature(_sign(body), body + b' '))
+        self.assertFalse(lineworks_api.verify_signature(_sign(body, "other_secret"), body))
+
+    def test_missing_or_malformed_signature(self):
+        """署名ヘッダーが無い・Base64として不正な場合は検証に失敗すること"""
+        body = b'{"type":"message"}'
+        for header in (None, "", "not base64!", _sign(body)[:-2]):
+            self.assertFalse(lineworks_api.verify_signature(header, body), header)
+
+    def test_missing_bot_secret_recovers(self):
+        """Bot Secretを取得できない間は検証に失敗し、取得できるようになれば成功すること"""
+        body = b'{"type":"message"}'
+        with patch.object(config, 'LINEWORKS_BOT_SECRET', None):
+            self.assertFalse(lineworks_api.verify_signature(_sign(body), body))
+        # 失敗時の None はキャッシュされず、次回の呼び出しで再取得される
+        self.assertTrue(lineworks_api.verify_signature(_sign(body), body))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -97,6 +97,12 @@ resource "google_cloud_run_v2_service" "acceptor" {
     containers {
       image = "us-docker.pkg.dev/cloudrun/container/hello" 
 
+      resources {
+        # Cloud Taskの作成はレスポンス（200 OK）を返した後にバックグラウンドで行うため、
+        # リクエスト処理外でもCPUを割り当てたままにする（既定ではレスポンス後にCPUが絞られ、作成が遅延・欠落する）
+        cpu_idle = false
+      }
+
       # --- 通常の環境変数 ---
       env {
         name  = "ENV"
@@ -183,6 +189,11 @@ resource "google_cloud_run_v2_service" "worker" {
     service_account = google_service_account.worker.email
     timeout = "300s"
 
+    # 1インスタンスで同時に受け付けるリクエスト数
+    # タスクの大半はDocument AI等の外部I/O待ちのため、gunicornのスレッド総数
+    # (ワーカー2 x スレッド8) に合わせて複数タスクを並行処理する
+    max_instance_request_concurrency = 16
+
     # --- Volume Mount 定義 (Secretをファイルとしてマウント) ---
     volumes {
       name = "sa-key-volume"
@@ -26,6 +26,17 @@ resource "google_storage_bucket" "assets" {
       type = "Delete"
     }
   }
+
+  # ライフサイクルルール: 一時領域(staging/)に取り残された原本画像は1日で自動削除
+  lifecycle_rule {
+    condition {
+      age            = 1
+      matches_prefix = ["staging/"]
+    }
+    action {
+      type = "Delete"
+    }
+  }
 }
 
 # ---------------------------------------------------------
@@ -0,0 +1,124 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# 独自のモジュールをインポート
+import lineworks_api
+
+# バッチをまとめる待ち時間（ミリ秒）と、1バッチの最大件数
+_MAX_WAIT_MS = 50
+_MAX_BATCH = 32
+# バッチ内の異なるキーの処理を並行実行する最大数
+_FLUSH_MAX_WORKERS = 4
+
+class MicroBatcher:
+    """
+    短い時間窓の間に投入されたリクエストをキーごとにまとめ、同一キーの処理を1回だけ実行する。
+    結果は同じキーで待っている全てのFutureに配布する。
+    キーごとに独立して実行するため、あるキーの処理が失敗しても他のキーには影響しない。
+    """
+    def __init__(self, func, max_wait_ms: int = _MAX_WAIT_MS, max_batch: int = _MAX_BATCH, name: str = "batcher"):
+        self._func = func
+        self._max_wait = max_wait_ms / 1000
+        self._max_batch = max_batch
+        self._name = name
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=_FLUSH_MAX_WORKERS, thread_name_prefix=f"{name}-flush")
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, key) -> Future:
+        """
+        キーを投入し、結果を受け取るFutureを返す。
+        trace_idをログに引き継ぐため、呼び出し元のコンテキストも一緒に渡す。
+        """
+        future = Future()
+        self._ensure_started()
+        self._queue.put((key, future, contextvars.copy_context()))
+        return future
+
+    def _ensure_started(self):
+        """バックグラウンドのフラッシュスレッドを初回投入時に起動する（遅延起動）。"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """最初の1件を受け取ってから max_wait_ms または max_batch に達するまで集め、フラッシュする。"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        """バッチをキーごとにまとめ、ユニークなキーの数だけ処理を実行する。"""
+        groups = {}
+        for key, future, ctx in batch:
+            # 同一キーの処理は、最初に投入した呼び出し元のコンテキストで実行する
+            groups.setdefault(key, (ctx, []))[1].append(future)
+
+        if len(groups) < len(batch):
+            logging.info(f"{self._name}: {len(batch)}件のリクエストを{len(groups)}件の処理にまとめました。")
+
+        for key, (ctx, futures) in groups.items():
+            self._executor.submit(ctx.run, self._resolve, key, futures)
+
+    def _resolve(self, key, futures):
+        """キーの処理を1回実行し、結果（または例外）を全てのFutureに設定する。"""
+        try:
+            result = self._func(key)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future in futures:
+            future.set_result(result)
+
+# タスク間で共有する店舗コード取得用のバッチャー（遅延初期化用）
+_store_code_batcher = None
+_store_code_batcher_lock = threading.Lock()
+
+def _get_store_code_batcher():
+    """
+    店舗コード取得用のMicroBatcherのシングルトンを取得する。
+    初回呼び出し時のみ初期化を行う（遅延ロード）。
+    """
+    global _store_code_batcher
+    if _store_code_batcher is None:
+        with _store_code_batcher_lock:
+            if _store_code_batcher is None:
+                # テストでのパッチ適用を妨げないよう、呼び出し時に関数を参照する
+                _store_code_batcher = MicroBatcher(
+                    lambda user_id: lineworks_api.get_store_code_by_user(user_id),
+                    name="store-code-batcher"
+                )
+    return _store_code_batcher
+
+def get_store_code(user_id) -> Future:
+    """
+    ユーザーIDから店舗コードを取得するFutureを返す。
+    同時期に同じユーザーから届いたタスクの取得は1回のAPI呼び出しにまとめられる。
+    Futureの結果は lineworks_api.get_store_code_by_user と同じ (店舗コード, エラーメッセージ) のタプル。
+    キャッシュ済みの場合はバッチの待ち時間を挟まず、完了済みのFutureを返す。
+    """
+    store_code = lineworks_api.get_cached_store_code(user_id)
+    if store_code is not None:
+        logging.info(f"店舗コードをキャッシュから取得: userId={user_id}")
+        future = Future()
+        future.set_result((store_code, None))
+        return future
+    return _get_store_code_batcher().submit(user_id)
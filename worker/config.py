@@ -1,22 +1,62 @@
 import os
 from pathlib import Path
 import logging
-from secret_manager import get_secret
+import unicodedata
+from secret_manager import get_secret, prefetch_secrets
 
 # ロガーを設定
 logger = logging.getLogger(__name__)
 
-# --- LINE WORKS Bot 設定 ---
-LINEWORKS_BOT_ID = get_secret('LINEWORKS_BOT_ID', logger)
+# --- シークレットとして管理する設定値 ---
+# これらはモジュール属性として初めて参照された時点で取得する（PEP 562 の __getattr__ を使用）
+_SECRET_NAMES = frozenset({
+    # --- LINE WORKS Bot 設定 ---
+    'LINEWORKS_BOT_ID',
+    # --- Service Account 設定 ---
+    'SA_CLIENT_ID',
+    'SA_CLIENT_SECRET',
+    'SA_SERVICE_ACCOUNT',
+    # ---AWS S3 設定  ---
+    'AWS_S3_BUCKET_NAME',
+    'AWS_ACCESS_KEY_ID',
+    'AWS_SECRET_ACCESS_KEY',
+    'AWS_S3_REGION',
+    # アップロード先のGCSバケット名
+    'GCS_BUCKET_NAME',
+    # ---Document AI 設定 ---
+    # Document AI プロセッサが設置されているリージョン
+    'DOC_AI_LOCATION',
+    # トレーニングしたプロセッサのID
+    'DOC_AI_PROCESSOR_ID',
+    # 特定のバージョンのID
+    'DOC_AI_PROCESSOR_VERSION_ID',
+    # GCPプロジェクトIDは他の場所でも使われるため、一元管理
+    'GCP_PROJECT_ID',
+})
+
+# --- シークレットの一括取得 ---
+# 起動時にSecret Managerへのアクセスを並列化し、以降のget_secret呼び出しをキャッシュから返す
+# 取得に失敗したものは、属性の初回参照時に改めて個別に取得される
+prefetch_secrets(sorted(_SECRET_NAMES), logger)
+
+def __getattr__(name):
+    """
+    シークレット由来の設定値を遅延取得する。
+    取得に成功した値はモジュールのグローバルに格納し、以降は通常の属性参照で返す。
+    """
+    if name in _SECRET_NAMES:
+        value = get_secret(name, logger)
+        # 取得に失敗した場合（None）は格納せず、次回の参照時に再取得する
+        if value is not None:
+            globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- LINE WORKS API 設定 ---
 LINEWORKS_API_BASE = "https://www.worksapis.com/v1.0"
 LINEWORKS_TOKEN_URL = 'https://auth.worksmobile.com/oauth2/v2.0/token'
 
 # --- Service Account 設定 ---
-SA_CLIENT_ID = get_secret('SA_CLIENT_ID', logger)
-SA_CLIENT_SECRET = get_secret('SA_CLIENT_SECRET', logger)
-SA_SERVICE_ACCOUNT = get_secret('SA_SERVICE_ACCOUNT', logger)
 # !!! 重要: keyファイルのパスを間違いないように設定 !!!
 # このパスはCloud Runのボリュームマウントによって提供される
 SA_PRIVATE_KEY_PATH = os.environ.get('SA_PRIVATE_KEY_PATH')
@@ -24,27 +64,13 @@ SA_PRIVATE_KEY_PATH = os.environ.get('SA_PRIVATE_KEY_PATH')
 # ---Bot権限スコープ ---
 SA_SCOPES = 'bot bot.message user.read orgunit.read'
 
-# ---AWS S3 設定  ---
-AWS_S3_BUCKET_NAME = get_secret('AWS_S3_BUCKET_NAME', logger)
-AWS_ACCESS_KEY_ID = get_secret('AWS_ACCESS_KEY_ID', logger)
-AWS_SECRET_ACCESS_KEY = get_secret('AWS_SECRET_ACCESS_KEY', logger)
-AWS_S3_REGION = get_secret('AWS_S3_REGION', logger)
-
-# アップロード先のGCSバケット名
-GCS_BUCKET_NAME = get_secret('GCS_BUCKET_NAME', logger)
-
-# ---Document AI 設定 ---
-# Document AI プロセッサが設置されているリージョン
-DOC_AI_LOCATION = get_secret('DOC_AI_LOCATION', logger)
-# トレーニングしたプロセッサのID
-DOC_AI_PROCESSOR_ID = get_secret('DOC_AI_PROCESSOR_ID', logger)
-# 特定のバージョンのID
-DOC_AI_PROCESSOR_VERSION_ID = get_secret('DOC_AI_PROCESSOR_VERSION_ID', logger)
-# GCPプロジェクトIDは他の場所でも使われるため、一元管理
-GCP_PROJECT_ID = get_secret('GCP_PROJECT_ID', logger)
-
 # --- CSV とファイル処理設定 ---
-KEYWORDS = ["クレジット支払", "クレジット受入", "現金支払", "現金受入"]
+# タイトルの照合はリクエストごとに行うため、O(1)で判定できる frozenset で保持する
+# OCR結果と同じくNFKC正規化した形で保持し、全角・半角などの表記揺れで照合に失敗しないようにする
+KEYWORDS = frozenset(
+    unicodedata.normalize('NFKC', keyword)
+    for keyword in ("クレジット支払", "クレジット受入", "現金支払", "現金受入")
+)
 # タイトル揺らぎ補正用の特徴文字セット（原子レベルでのAND検索用）
 CREDIT_CHARS = {'ク', 'レ', 'ジ', 'ッ', 'ト'}
 CASH_CHARS = {'現', '金'}
@@ -53,9 +79,44 @@ RECEIPT_CHARS = {'受', '入'}
 
 DEFAULT_PREFIX = "unknown_form"
 
+# --- 画像処理設定 ---
+# 受け付ける画像ファイルの最大サイズ（バイト）。Document AIのオンライン処理の上限に合わせる
+MAX_IMAGE_BYTES = 20 * 1024 * 1024 # 20MB
+# 用紙背景の明るさの標準偏差がこの値未満の画像は照明ムラ（影）が無いとみなし、
+# 回転も不要であれば影除去・再エンコードを省略して元画像をそのまま使用する
+IMAGE_FAST_PATH_MAX_BG_STDDEV = 5.0
+# 画像の前処理を実行する子プロセスの数（0の場合は子プロセスを使わず、リクエストのスレッドで実行する）
+# 複数のvCPUを割り当てたインスタンスで、前処理をGILに縛られず並列実行したい場合に設定する
+IMAGE_PROCESS_WORKERS = int(os.environ.get('IMAGE_PROCESS_WORKERS', '0'))
+# 1プロセス内で同時に実行する画像の前処理の最大数（CPU・メモリを多く使うため、I/O待ちのタスク数とは別に制限する）
+IMAGE_PROCESS_CONCURRENCY = max(1, IMAGE_PROCESS_WORKERS)
+
+# --- 並行処理設定 ---
+# 1プロセス（gunicornワーカー）が同時に処理するタスク数。Procfile の --threads と同じ環境変数から取得する
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', '8'))
+# タスク間で共有するI/O用スレッドプールの大きさ
+# 1タスクは一時領域への保存・GCS・S3・通知のうち最大2件程度を同時に投入するため、同時タスク数の2倍を既定とする
+IO_EXECUTOR_WORKERS = int(os.environ.get('IO_EXECUTOR_WORKERS', str(GUNICORN_THREADS * 2)))
+
 
 # --- その他の設定 ---
 # Access Token キャッシュの事前更新時間（秒）
 TOKEN_REFRESH_BUFFER = 300 # 5分
 # Access Token デフォルト有効期間（秒）
-DEFAULT_TOKEN_EXPIRY = 3600 # 1時間
\ No newline at end of file
+DEFAULT_TOKEN_EXPIRY = 3600 # 1時間
+# Access Token 取得用 JWT の有効期間（秒）
+JWT_EXPIRY = 300 # 5分
+# キャッシュしたJWTを再利用せず再生成する、有効期限までの残り時間（秒）
+JWT_REUSE_BUFFER = 30
+
+# --- キャッシュ設定 ---
+# 店舗の所属は数時間〜数日単位で安定しているため、userId -> 店舗コードをTTL付きで保持する
+STORE_CODE_CACHE_MAXSIZE = 1024
+STORE_CODE_CACHE_TTL = 3600 # 1時間
+# 組織情報は複数ユーザーで共有されるため、同じ有効期間で保持する
+ORG_UNIT_CACHE_MAXSIZE = 1024
+ORG_UNIT_CACHE_TTL = 3600 # 1時間
+# Document AIの処理結果（同一画像の再送時に再利用する）
+# ページ画像などのバイナリは除いて保持するが、gunicornのプロセスごとに持つため件数を絞る
+DOC_AI_CACHE_MAXSIZE = 16
+DOC_AI_CACHE_TTL = 3600 # 1時間
@@ -2,6 +2,18 @@ import csv
 import io
 import datetime
 
+# 日本標準時(JST)のタイムゾーン（呼び出しごとに生成しないようモジュールレベルで保持）
+_JST = datetime.timezone(datetime.timedelta(hours=9))
+
+# CSVのヘッダーは「項目」と「金額」のみに限定
+_CSV_HEADER = ('項目', '金額')
+_LINE_TERMINATOR = '\r\n'
+_CSV_HEADER_BYTES = (','.join(_CSV_HEADER) + _LINE_TERMINATOR).encode('utf-8')
+# csv.writer(QUOTE_MINIMAL)がクォートを必要とする文字
+_QUOTE_TRIGGER_CHARS = (',', '"', '\r', '\n')
+# ファイル名に使えない・紛らわしい文字を '_' に置換する変換テーブル（'/'、半角スペース、全角スペース）
+_FILENAME_TRANSLATION = str.maketrans({'/': '_', ' ': '_', '\u3000': '_'})
+
 def generate_csv_filename(store_code: str, title: str):
     """
     GCSにアップロードするためのCSVファイル名を動的に生成する。
@@ -14,15 +26,12 @@ def generate_csv_filename(store_code: str, title: str):
     Returns:
         str: 生成された完全なファイルパス。
     """
-    jst = datetime.timezone(datetime.timedelta(hours=9))
-    now_jst = datetime.datetime.now(jst)
-    
     # タイムスタンプ部分のファイル名を生成
-    timestamp_str = now_jst.strftime('%Y%m%d%H%M%S')
+    timestamp_str = datetime.datetime.now(_JST).strftime('%Y%m%d%H%M%S')
     
     # titleに含まれる可能性のある不正なファイル名文字を置換
     # 例: '/' や ' ' などを '_' に置換
-    safe_title = title.replace('/', '_').replace(' ', '_').replace('　', '_') if title else "NoTitle"
+    safe_title = title.translate(_FILENAME_TRANSLATION) if title else "NoTitle"
 
     base_filename = f"{timestamp_str}_{store_code}_{safe_title}.csv"
     
@@ -32,30 +41,44 @@ def generate_csv_filename(store_code: str, title: str):
 
 def generate_csv_content(parsed_data: dict):
     """
-    解析済みのデータ辞書からCSVファイルの内容（文字列）を生成する。
+    解析済みのデータ辞書からCSVファイルの内容（UTF-8のバイト列）を生成する。
     「項目」と「金額」の2列のみを出力する。
 
     Args:
         parsed_data (dict): doc_ai_parserから返された解析済みデータ。
 
     Returns:
-        tuple: (CSV文字列, エラーメッセージ)
+        tuple: (CSVのバイト列, エラーメッセージ)
     """
-
-    output = io.StringIO()
-    
-    # CSVのヘッダーを「項目」と「金額」のみに限定
-    fieldnames = ['項目', '金額']
-    writer = csv.DictWriter(output, fieldnames=fieldnames, lineterminator='\r\n')
-    writer.writeheader()
-    
     # 'line_items' が存在し、かつ空でない場合のみ、行を書き込む
+    rows = []
     if parsed_data and parsed_data.get('line_items'):
         for item_detail in parsed_data['line_items']:
-            writer.writerow({
-                '項目': item_detail.get('item', ''),
-                '金額': item_detail.get('amount', '')
-            })
-        
-    # 文字列としてCSVの内容を返す
-    return output.getvalue(), None
\ No newline at end of file
+            rows.append((_to_field(item_detail.get('item', '')), _to_field(item_detail.get('amount', ''))))
+
+    # クォートが必要な文字を含まない場合は、csvモジュールを介さずに直接組み立てる
+    if not any(_needs_quoting(field) for row in rows for field in row):
+        body = ''.join(f"{item},{amount}{_LINE_TERMINATOR}" for item, amount in rows)
+        return _CSV_HEADER_BYTES + body.encode('utf-8'), None
+
+    # クォートが必要な場合のみcsv.writerで書き込む
+    # 文字列を組み立ててから改めてエンコードせず、書き込みと同時にUTF-8のバッファへ出力する
+    buffer = io.BytesIO()
+    output = io.TextIOWrapper(buffer, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(output, lineterminator=_LINE_TERMINATOR)
+    writer.writerow(_CSV_HEADER)
+    writer.writerows(rows)
+    output.flush()
+
+    # UTF-8のバイト列としてCSVの内容を返す
+    return buffer.getvalue(), None
+
+
+def _to_field(value) -> str:
+    """CSVの1フィールド分の値を文字列に変換する（Noneは空文字として扱う）。"""
+    return '' if value is None else str(value)
+
+
+def _needs_quoting(field: str) -> bool:
+    """フィールドがCSVのクォート対象となる文字を含むかどうかを判定する。"""
+    return any(char in field for char in _QUOTE_TRIGGER_CHARS)
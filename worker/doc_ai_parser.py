@@ -1,14 +1,46 @@
 import logging
+import operator
+import numpy as np
 from google.cloud import documentai
 from collections import defaultdict
 import re
+import unicodedata
 from dataclasses import dataclass
 from typing import List, Optional, Tuple
 import config
 
+# --- 事前コンパイル済みのパターン・変換テーブル ---
+# 金額テキストから半角数字以外を除去するための正規表現
+_NON_DIGIT = re.compile(r'[^0-9]+')
+# 項目テキストの空白(半角・全角)を削除し、'@'を'(a)'に置換するための変換テーブル
+_ITEM_TRANS = str.maketrans({' ': None, '　': None, '@': '(a)'})
+# 座標ベースでペアリングする明細行のエンティティタイプ
+_LINE_ITEM_TYPES = ('item', 'amount')
+# ソート用のキー関数（C実装のattrgetterを使用）
+_BY_Y = operator.attrgetter('center_y')
+_BY_X = operator.attrgetter('center_x')
+# 帳票ごとに1つだけ抽出する項目
+_SINGLE_VALUE_FIELDS = ('title', 'shop_name', 'date')
+# 行分割をNumPyで行うエンティティ数の下限
+_NUMPY_GROUPING_MIN_ENTITIES = 50
+
+# タイトル正規化用: 特徴文字 -> 種別ビットのマッピング（1回の走査で全種別を判定する）
+_CREDIT_BIT, _CASH_BIT, _PAYMENT_BIT, _RECEIPT_BIT = 1, 2, 4, 8
+
+def _build_title_char_mask() -> dict:
+    """特徴文字セットから、文字ごとの種別ビットを保持する辞書を作成する。"""
+    char_mask = {}
+    for chars, bit in ((config.CREDIT_CHARS, _CREDIT_BIT), (config.CASH_CHARS, _CASH_BIT),
+                       (config.PAYMENT_CHARS, _PAYMENT_BIT), (config.RECEIPT_CHARS, _RECEIPT_BIT)):
+        for char in chars:
+            char_mask[char] = char_mask.get(char, 0) | bit
+    return char_mask
+
+_TITLE_CHAR_MASK = _build_title_char_mask()
+
 # --- データ構造を定義 ---
 
-@dataclass
+@dataclass(slots=True)
 class ParsedEntity:
     """Document AIのエンティティから抽出した、扱いやすい中間データ構造。"""
     text: str
@@ -24,8 +56,8 @@ class ParsedEntity:
 
 # --- ヘルパー関数 ---
 
-def _create_parsed_entity(entity: documentai.Document.Entity) -> Optional[ParsedEntity]:
-    """安全にParsedEntityオブジェクトを作成する。"""
+def _extract_coordinates(entity: documentai.Document.Entity) -> Optional[Tuple[List[float], List[float]]]:
+    """エンティティの頂点座標を安全に取り出す。取り出せない場合はNoneを返す。"""
     try:
         if not entity.page_anchor.page_refs: return None
         vertices = entity.page_anchor.page_refs[0].bounding_poly.normalized_vertices
@@ -35,20 +67,59 @@ def _create_parsed_entity(entity: documentai.Document.Entity) -> Optional[Parsed
         y_coords = [v.y for v in vertices if v.y is not None]
         if not x_coords or not y_coords: return None
 
-        y_min, y_max = min(y_coords), max(y_coords)
-        x_min, x_max = min(x_coords), max(x_coords)
-        
-        return ParsedEntity(
+        return x_coords, y_coords
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def _bulk_parse_entities(entities) -> List[ParsedEntity]:
+    """
+    項目・金額エンティティの座標をまとめてNumPy配列に展開し、
+    外接矩形の計算をベクトル化してParsedEntityのリストを作成する。
+    """
+    targets = []
+    all_x, all_y = [], []
+    x_offsets, y_offsets = [], []
+
+    for entity in entities:
+        if entity.type_ not in _LINE_ITEM_TYPES: continue
+        coordinates = _extract_coordinates(entity)
+        if coordinates is None: continue
+
+        x_coords, y_coords = coordinates
+        x_offsets.append(len(all_x))
+        y_offsets.append(len(all_y))
+        all_x.extend(x_coords)
+        all_y.extend(y_coords)
+        targets.append(entity)
+
+    if not targets: return []
+
+    # エンティティごとに頂点数が異なっても扱えるよう、reduceatで区間ごとの最小・最大を求める
+    xs = np.asarray(all_x, dtype=np.float64)
+    ys = np.asarray(all_y, dtype=np.float64)
+    x_min = np.minimum.reduceat(xs, x_offsets)
+    x_max = np.maximum.reduceat(xs, x_offsets)
+    y_min = np.minimum.reduceat(ys, y_offsets)
+    y_max = np.maximum.reduceat(ys, y_offsets)
+
+    center_y = ((y_min + y_max) / 2).tolist()
+    center_x = ((x_min + x_max) / 2).tolist()
+    height = (y_max - y_min).tolist()
+    x_min = x_min.tolist()
+    x_max = x_max.tolist()
+
+    return [
+        ParsedEntity(
             text=entity.mention_text.replace('\n', ''),
             type=entity.type_,
-            center_y=(y_min + y_max) / 2,
-            center_x=(x_min + x_max) / 2,
-            x_min=x_min,
-            x_max=x_max,
-            height=(y_max - y_min)
+            center_y=center_y[i],
+            center_x=center_x[i],
+            x_min=x_min[i],
+            x_max=x_max[i],
+            height=height[i]
         )
-    except (AttributeError, IndexError, ValueError):
-        return None
+        for i, entity in enumerate(targets)
+    ]
 
 def _calculate_dynamic_tolerance(entities: List[ParsedEntity]) -> float:
     """異常値を除外して、より安定したY座標の許容誤差を動的に計算する。"""
@@ -68,12 +139,8 @@ def _calculate_dynamic_tolerance(entities: List[ParsedEntity]) -> float:
     logging.info(f"動的なY座標の許容誤差を計算しました: {tolerance:.4f} (平均高さ: {avg_height:.4f})")
     return tolerance
 
-def _group_entities_by_row(entities: List[ParsedEntity], y_tolerance: float) -> List[List[ParsedEntity]]:
-    """隣接ベースのアルゴリズムで、全てのエンティティを行に分割する。"""
-    if not entities: return []
-
-    sorted_entities = sorted(entities, key=lambda e: e.center_y)
-    
+def _group_sorted_entities(sorted_entities: List[ParsedEntity], y_tolerance: float) -> List[List[ParsedEntity]]:
+    """Y座標でソート済みのエンティティを、Pythonのループで行に分割する。"""
     groups = []
     current_group = [sorted_entities[0]]
 
@@ -89,6 +156,45 @@ def _group_entities_by_row(entities: List[ParsedEntity], y_tolerance: float) ->
             current_group = [current_entity]
     
     groups.append(current_group)
+    return groups
+
+def _group_entities_by_row_numpy(entities: List[ParsedEntity], y_tolerance: float) -> List[List[ParsedEntity]]:
+    """
+    NumPyでY座標をソートし、各行の終端を二分探索で求めて行に分割する。
+    グループ先頭のY座標を基準とする点は、Python版と同じ判定になる。
+    """
+    ys = np.fromiter((e.center_y for e in entities), dtype=np.float64, count=len(entities))
+    order = np.argsort(ys, kind='stable')
+    sorted_ys = ys[order]
+    order = order.tolist()
+    n = len(order)
+
+    groups = []
+    start = 0
+    while start < n:
+        base_y = sorted_ys[start]
+        end = int(np.searchsorted(sorted_ys, base_y + y_tolerance, side='left'))
+        # 浮動小数点の丸め誤差で境界がずれないよう、元の判定式で境界を補正する
+        while end < n and sorted_ys[end] - base_y < y_tolerance:
+            end += 1
+        while end > start + 1 and not (sorted_ys[end - 1] - base_y < y_tolerance):
+            end -= 1
+        end = max(end, start + 1)
+
+        groups.append([entities[i] for i in order[start:end]])
+        start = end
+
+    return groups
+
+def _group_entities_by_row(entities: List[ParsedEntity], y_tolerance: float) -> List[List[ParsedEntity]]:
+    """隣接ベースのアルゴリズムで、全てのエンティティを行に分割する。"""
+    if not entities: return []
+
+    # エンティティ数が少ない場合は、NumPyの呼び出しコストの方が大きいためPythonで処理する
+    if len(entities) < _NUMPY_GROUPING_MIN_ENTITIES:
+        groups = _group_sorted_entities(sorted(entities, key=_BY_Y), y_tolerance)
+    else:
+        groups = _group_entities_by_row_numpy(entities, y_tolerance)
 
     logging.info(f"エンティティを行に分割しました: {len(groups)}行")
     for i, group in enumerate(groups):
@@ -105,11 +211,18 @@ def _normalize_title(raw_title: str) -> str:
     if not raw_title:
         return raw_title
 
-    # 特徴文字の含有チェック
-    has_credit = any(c in raw_title for c in config.CREDIT_CHARS)
-    has_cash = any(c in raw_title for c in config.CASH_CHARS)
-    has_payment = any(c in raw_title for c in config.PAYMENT_CHARS)
-    has_receipt = any(c in raw_title for c in config.RECEIPT_CHARS)
+    # 半角カナ・全角英数などの表記揺れを、特徴文字の判定前にNFKCで統一する
+    raw_title = unicodedata.normalize('NFKC', raw_title)
+
+    # 特徴文字の含有チェック（1回の走査でビットマスクに集約する）
+    mask = 0
+    for char in raw_title:
+        mask |= _TITLE_CHAR_MASK.get(char, 0)
+
+    has_credit = mask & _CREDIT_BIT
+    has_cash = mask & _CASH_BIT
+    has_payment = mask & _PAYMENT_BIT
+    has_receipt = mask & _RECEIPT_BIT
 
     normalized_title = raw_title
 
@@ -142,22 +255,26 @@ def parse_document_entities(document: documentai.Document):
     # 【ステップ1: 前処理】
     item_entities: List[ParsedEntity] = []
     amount_entities: List[ParsedEntity] = []
-    extracted_data = {"title": None, "shop_name": None, "date": None, "line_items": []}
+    extracted_data = {field: None for field in _SINGLE_VALUE_FIELDS}
+    extracted_data["line_items"] = []
+
+    # 項目・金額エンティティの座標はまとめてベクトル化して計算する
+    for parsed_entity in _bulk_parse_entities(document.entities):
+        if parsed_entity.type == 'item':
+            item_entities.append(parsed_entity)
+        else:
+            amount_entities.append(parsed_entity)
 
+    # タイトル・店舗名・日付は最初に出現したものだけを採用する
+    remaining_fields = set(_SINGLE_VALUE_FIELDS)
     for entity in document.entities:
-        if entity.type_ in ['item', 'amount']:
-            parsed_entity = _create_parsed_entity(entity)
-            if parsed_entity:
-                if entity.type_ == 'item':
-                    item_entities.append(parsed_entity)
-                elif entity.type_ == 'amount':
-                    amount_entities.append(parsed_entity)
-        elif entity.type_ in extracted_data and extracted_data[entity.type_] is None:
+        if not remaining_fields:
+            break
+        entity_type = entity.type_
+        if entity_type in remaining_fields:
+            remaining_fields.discard(entity_type)
             raw_text = entity.mention_text.replace('\n', '')
-            if entity.type_ == 'title':
-                extracted_data[entity.type_] = _normalize_title(raw_text)
-            else:
-                extracted_data[entity.type_] = raw_text
+            extracted_data[entity_type] = _normalize_title(raw_text) if entity_type == 'title' else raw_text
 
     line_items = []
     is_review_needed = False
@@ -168,15 +285,12 @@ def parse_document_entities(document: documentai.Document):
         logging.info(f"項目と金額の数が一致 ({len(item_entities)}個)。順序ベースのペアリングを実行します。")
         
         # Y座標でソートして、上から順にペアリングする
-        sorted_items = sorted(item_entities, key=lambda e: e.center_y)
-        sorted_amounts = sorted(amount_entities, key=lambda e: e.center_y)
+        sorted_items = sorted(item_entities, key=_BY_Y)
+        sorted_amounts = sorted(amount_entities, key=_BY_Y)
 
-        for i in range(len(sorted_items)):
-            item = sorted_items[i]
-            amount = sorted_amounts[i]
-            
-            final_item_text = item.text.replace(' ', '').replace('　', '').replace('@', '(a)')
-            final_amount_text = re.sub(r'[^0-9]', '', amount.text)
+        for item, amount in zip(sorted_items, sorted_amounts):
+            final_item_text = item.text.translate(_ITEM_TRANS)
+            final_amount_text = _NON_DIGIT.sub('', amount.text)
 
             #クリーニング後のテキストをそのまま追加する。
             line_items.append({'item': final_item_text, 'amount': final_amount_text})
@@ -200,24 +314,24 @@ def parse_document_entities(document: documentai.Document):
             row_items = [entity for entity in row if entity.type == 'item']
             row_amounts = [entity for entity in row if entity.type == 'amount']
 
-            row_items.sort(key=lambda e: e.center_x)
-            row_amounts.sort(key=lambda e: e.center_x)
+            row_items.sort(key=_BY_X)
+            row_amounts.sort(key=_BY_X)
 
             merged_item_text = ' '.join(item.text for item in row_items)
-            final_item_text = merged_item_text.replace(' ', '').replace('　', '').replace('@', '(a)')
+            final_item_text = merged_item_text.translate(_ITEM_TRANS)
 
             final_amount_text = ''
             if len(row_items) > 0 and len(row_amounts) > 0:
                 if row_items[-1].x_max < row_amounts[0].x_min:
                     merged_amount_text = ' '.join(amount.text for amount in row_amounts)
-                    final_amount_text = re.sub(r'[^0-9]', '', merged_amount_text)
+                    final_amount_text = _NON_DIGIT.sub('', merged_amount_text)
                 else:
                     logging.warning(f"行内でのX座標の重なりを検出。項目: '{merged_item_text}', 金額: {[a.text for a in row_amounts]}。この行の金額は無視されます。")
                     final_amount_text = '' 
                     is_review_needed = True
             elif len(row_amounts) > 0:
                 merged_amount_text = ' '.join(amount.text for amount in row_amounts)
-                final_amount_text = re.sub(r'[^0-9]', '', merged_amount_text)
+                final_amount_text = _NON_DIGIT.sub('', merged_amount_text)
 
             if final_item_text and final_amount_text:
                 line_items.append({'item': final_item_text, 'amount': final_amount_text})
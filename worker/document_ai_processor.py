@@ -1,9 +1,51 @@
 from google.api_core.client_options import ClientOptions
 from google.cloud import documentai
+import hashlib
 import logging
+import threading
 
 # 独自のモジュールをインポート
 import config
+from ttl_cache import TTLCache
+
+# 同じ画像の再送時にOCRを再実行しないよう、内容のハッシュをキーに処理結果を保持する
+# (Document AIはページ単位の課金で数秒を要するため、ハッシュ計算のコストは無視できる)
+_document_cache = TTLCache(maxsize=config.DOC_AI_CACHE_MAXSIZE, ttl=config.DOC_AI_CACHE_TTL)
+
+# クライアントインスタンスをキャッシュするグローバル変数（遅延初期化用）
+# 認証情報の探索とgRPCチャネルの確立をリクエストごとに行わないよう、プロセス内で使い回す
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    """
+    DocumentProcessorServiceClientのシングルトンを取得する。
+    初回呼び出し時のみ初期化を行う（遅延ロード）。
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                opts = ClientOptions(
+                    api_endpoint=f"{config.DOC_AI_LOCATION}-documentai.googleapis.com"
+                )
+                _client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    return _client
+
+def _content_key(file_content_bytes: bytes, file_mime_type: str) -> str:
+    """ファイル内容とMIMEタイプからキャッシュキーを生成する。"""
+    digest = hashlib.blake2b(file_content_bytes, digest_size=16).hexdigest()
+    return f"{file_mime_type}:{digest}"
+
+def _strip_binary_payloads(document: documentai.Document) -> None:
+    """
+    キャッシュに格納する前に、解析で使用しない大きなバイナリ（元ファイルの内容とページ画像）を削除する。
+    document を直接書き換える（解析はエンティティとテキストのみを参照する）。
+    """
+    document_pb = documentai.Document.pb(document)
+    document_pb.ClearField('content')
+    for page in document_pb.pages:
+        page.ClearField('image')
 
 def process_document(file_content_bytes: bytes, file_mime_type: str):
     """
@@ -19,10 +61,13 @@ def process_document(file_content_bytes: bytes, file_mime_type: str):
     """
     logging.info("--- Document AI プロセッサモジュール ---")
 
-    opts = ClientOptions(
-        api_endpoint=f"{config.DOC_AI_LOCATION}-documentai.googleapis.com"
-    )
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    cache_key = _content_key(file_content_bytes, file_mime_type)
+    cached_document = _document_cache.get(cache_key)
+    if cached_document is not None:
+        logging.info("同一内容のファイルの処理結果をキャッシュから取得しました。Document AIの呼び出しを省略します。")
+        return cached_document, None
+
+    client = _get_client()
 
     # プロセッサのバージョンも指定する場合のロジック
     if config.DOC_AI_PROCESSOR_VERSION_ID:
@@ -54,6 +99,8 @@ def process_document(file_content_bytes: bytes, file_mime_type: str):
         document = result.document
         
         logging.info("Document AIによる処理が成功しました。")
+        _strip_binary_payloads(document)
+        _document_cache.set(cache_key, document)
         return document, None
 
     except Exception as e:
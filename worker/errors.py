@@ -0,0 +1,47 @@
+# errors.py
+
+class TaskError(Exception):
+    """
+    タスク処理中のエラーの基底クラス。
+    ユーザーに通知するメッセージと、Cloud Tasksによる再試行の対象とするかどうかを持つ。
+    """
+    # 一時的な障害の可能性があり、再試行で成功が見込めるかどうか
+    retryable = False
+
+    def __init__(self, message: str, user_facing_message: str = None):
+        super().__init__(message)
+        self.user_facing_message = user_facing_message
+
+class StoreLookupError(TaskError):
+    """店舗コードの取得に失敗した（LINE WORKS APIの一時的な障害を含む）。"""
+    retryable = True
+
+class DownloadError(TaskError):
+    """添付ファイルのダウンロードに失敗した。"""
+    retryable = True
+
+class InvalidFileError(TaskError):
+    """ファイルのサイズや形式が不正で、処理できない。"""
+
+class OCRError(TaskError):
+    """Document AIでの処理に失敗した。"""
+    retryable = True
+
+class TitleNotRecognizedError(TaskError):
+    """帳票からタイトル（有効なデータ）を読み取れなかった。"""
+
+class KeywordNotMatchedError(TaskError):
+    """読み取ったタイトルが対応する帳票の種類に該当しない。"""
+
+class CsvGenerationError(TaskError):
+    """CSVファイルの内容の生成に失敗した。"""
+
+class UploadError(TaskError):
+    """処理結果のアップロードに失敗した。"""
+    retryable = True
+
+class NotifyError(TaskError):
+    """
+    ユーザーへの成功通知の送信に失敗した。
+    成果物のアップロードは完了しているため、再試行すると成果物が重複して保存される。再試行の対象としない。
+    """
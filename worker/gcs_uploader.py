@@ -3,14 +3,54 @@ from google.cloud.exceptions import NotFound
 import logging
 import datetime
 import os
+import uuid
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # 独自のモジュールをインポート
 import config
 
+# 保存先が確定する前の原本画像を置く一時領域のプレフィックス
+STAGING_PREFIX = "staging/"
+
+# バケットオブジェクトをキャッシュするグローバル変数（遅延初期化用）
+# クライアントの生成（認証情報の探索）とバケットの存在確認は初回のみ行い、以降は使い回す
+_bucket = None
+_bucket_lock = threading.Lock()
+
+def _get_bucket():
+    """
+    アップロード先バケットのシングルトンを取得する。
+    初回呼び出し時のみクライアントを初期化し、バケットの存在を確認する（遅延ロード）。
+    バケットが存在しない場合は None を返す（次回呼び出し時に改めて確認する）。
+    """
+    global _bucket
+    if _bucket is None:
+        with _bucket_lock:
+            if _bucket is None:
+                # Cloud Run環境では、サービスアカウントの権限が自動的に使用される
+                bucket = storage.Client().bucket(config.GCS_BUCKET_NAME)
+                if not bucket.exists():
+                    return None
+                _bucket = bucket
+    return _bucket
+
+# 1回の保存処理で発生する複数オブジェクトのアップロードを並行実行するためのスレッドプール
+_UPLOAD_MAX_WORKERS = 4
+_upload_executor = ThreadPoolExecutor(max_workers=_UPLOAD_MAX_WORKERS, thread_name_prefix="gcs-upload")
+
+# 日本標準時(JST)のタイムゾーン（呼び出しごとに生成しないようモジュールレベルで保持）
+_JST = datetime.timezone(datetime.timedelta(hours=9))
+
 def _get_current_jst_now() -> datetime.datetime:
     """現在の日時(JST)を取得して返す"""
-    jst = datetime.timezone(datetime.timedelta(hours=9))
-    return datetime.datetime.now(jst)
+    return datetime.datetime.now(_JST)
+
+def _split_ymd(now: datetime.datetime) -> tuple[str, str, str]:
+    """日時を一度だけフォーマットし、年・月・日の文字列に分割して返す"""
+    ymd = now.strftime('%Y%m%d')
+    return ymd[:4], ymd[4:6], ymd[6:8]
 
 def _upload_with_logging(file_bytes: bytes, gcs_path: str, content_type: str, description: str):
     """
@@ -21,6 +61,35 @@ def _upload_with_logging(file_bytes: bytes, gcs_path: str, content_type: str, de
     if err:
         logging.warning(f"GCS{description}への保存に失敗: {err}")
 
+def _store_image_with_logging(image_bytes: bytes, staged_image_path: str, gcs_path: str, description: str):
+    """
+    原本画像をGCSに保存する。
+    一時領域にアップロード済み(staged_image_path)の場合は、バイト列を再送せずサーバー側コピーで保存する。
+    コピーに失敗した場合や一時領域が無い場合は、通常のアップロードを行う。
+    """
+    if staged_image_path:
+        logging.info(f"GCS{description}への保存を開始 (一時領域からコピー): {gcs_path}")
+        _, err = copy_in_gcs(staged_image_path, gcs_path)
+        if not err:
+            return
+        logging.warning(f"GCS{description}へのコピーに失敗したため、アップロードで保存します: {err}")
+    _upload_with_logging(image_bytes, gcs_path, 'image/jpeg', description)
+
+def _run_concurrently(jobs):
+    """
+    互いに独立したアップロード処理(関数, 引数...)を並行実行し、全ての完了を待つ。
+    trace_idをログに引き継ぐため、各処理は現在のコンテキストのコピー上で実行する。
+    """
+    futures = [
+        _upload_executor.submit(contextvars.copy_context().run, func, *args)
+        for func, *args in jobs
+    ]
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            logging.warning("GCSへの並行アップロード中に予期せぬエラーが発生しました。", exc_info=True)
+
 def _extract_date_parts_from_filename(filename: str) -> tuple[str, str, str, str]:
     """
     ファイル名から日付を抽出し、フォーマット済み文字列と年月日を返す。
@@ -38,16 +107,31 @@ def _extract_date_parts_from_filename(filename: str) -> tuple[str, str, str, str
         logging.warning(f"ファイル名 '{filename}' からの日付抽出に失敗。現在時刻でフォールバックします。")
 
     # フォールバック: 現在時刻を使用
-    now = _get_current_jst_now()
-    year, month, day = now.strftime('%Y'), now.strftime('%m'), now.strftime('%d')
+    year, month, day = _split_ymd(_get_current_jst_now())
     date_str = f"{year}年{month}月{day}日"
     return date_str, year, month, day
 
-def upload_processed_results(is_review_needed: bool, store_code: str, csv_filename: str, image_bytes: bytes, csv_bytes: bytes, processed_image_bytes: bytes = None):
+def upload_staging_image(image_bytes: bytes):
+    """
+    原本画像を一時領域(staging/)にアップロードする。
+    保存先のパスが確定する前にアップロードを済ませておき、確定後はサーバー側コピーで各フォルダに保存する。
+    一時領域のファイルはコピー後に削除する（残った場合もライフサイクルルールで削除される）。
+
+    Returns:
+        tuple: (一時領域のオブジェクト名, エラーメッセージ)
+    """
+    staging_path = f"{STAGING_PREFIX}{uuid.uuid4().hex}.jpg"
+    _, err = upload_to_gcs(image_bytes, staging_path, content_type='image/jpeg')
+    if err:
+        return None, err
+    return staging_path, None
+
+def upload_processed_results(is_review_needed: bool, store_code: str, csv_filename: str, image_bytes: bytes, csv_bytes: bytes, processed_image_bytes: bytes = None, staged_image_path: str = None):
     """
     画像とCSVファイルをGCSにアップロードする。
     全てのファイルをアーカイブに保存し、レビューが必要な場合は追加でレビュー用フォルダにも保存する。
     処理済み画像(processed_image_bytes)がある場合は、レビュー用フォルダにのみ保存する。
+    原本画像が一時領域にアップロード済み(staged_image_path)の場合は、そこからコピーして保存する。
     """
     try:
         # ファイル名から日付関連の情報を取得
@@ -61,8 +145,10 @@ def upload_processed_results(is_review_needed: bool, store_code: str, csv_filena
         archive_image_path = f"{archive_base_path}/{image_filename_for_gcs}"
         archive_csv_path = f"{archive_base_path}/{csv_filename}"
 
-        _upload_with_logging(image_bytes, archive_image_path, 'image/jpeg', 'アーカイブ(画像)')
-        _upload_with_logging(csv_bytes, archive_csv_path, 'text/csv', 'アーカイブ(CSV)')
+        jobs = [
+            (_store_image_with_logging, image_bytes, staged_image_path, archive_image_path, 'アーカイブ(画像)'),
+            (_upload_with_logging, csv_bytes, archive_csv_path, 'text/csv', 'アーカイブ(CSV)'),
+        ]
 
         # 2. レビューが必要な場合は、追加でreview-neededフォルダにも保存
         if is_review_needed:
@@ -71,44 +157,55 @@ def upload_processed_results(is_review_needed: bool, store_code: str, csv_filena
             review_image_path = f"{review_base_path}/{image_filename_for_gcs}"
             review_csv_path = f"{review_base_path}/{csv_filename}"
 
-            _upload_with_logging(image_bytes, review_image_path, 'image/jpeg', 'レビュー用(画像)')
-            _upload_with_logging(csv_bytes, review_csv_path, 'text/csv', 'レビュー用(CSV)')
+            jobs.append((_store_image_with_logging, image_bytes, staged_image_path, review_image_path, 'レビュー用(画像)'))
+            jobs.append((_upload_with_logging, csv_bytes, review_csv_path, 'text/csv', 'レビュー用(CSV)'))
             
             # 3. 処理済み画像がある場合、レビュー用フォルダに追加保存
             if processed_image_bytes:
                 processed_image_filename = f"{base_name}_processed.jpg"
                 review_processed_image_path = f"{review_base_path}/{processed_image_filename}"
-                _upload_with_logging(processed_image_bytes, review_processed_image_path, 'image/jpeg', 'レビュー用(処理済み画像)')
+                jobs.append((_upload_with_logging, processed_image_bytes, review_processed_image_path, 'image/jpeg', 'レビュー用(処理済み画像)'))
+
+        # 各オブジェクトは互いに独立しているため並行してアップロードする
+        # (一時領域の削除は finally で行うため、ここで全てのコピーの完了を待つ)
+        _run_concurrently(jobs)
 
     except Exception:
         logging.warning("GCSへのアップロード中に予期せぬエラーが発生しました。", exc_info=True)
+    finally:
+        if staged_image_path:
+            delete_from_gcs(staged_image_path)
 
-def upload_error_image(store_code: str, image_bytes: bytes, processed_image_bytes: bytes = None):
+def upload_error_image(store_code: str, image_bytes: bytes, processed_image_bytes: bytes = None, staged_image_path: str = None):
     """
     タイトルが読み取れなかった画像などを、後で確認できるようにGCSのレビュー用フォルダに保存する。
     ファイル名は YYYYMMDDHHMMSSSSS_{store_code}.jpg とする。
+    原本画像が一時領域にアップロード済み(staged_image_path)の場合は、そこからコピーして保存する。
     """
     try:
-        now = _get_current_jst_now()
-        year, month, day = now.strftime('%Y'), now.strftime('%m'), now.strftime('%d')
-
         # ファイル名とパスを生成 (時刻情報を追加してユニークにする)
-        timestamp_for_filename = now.strftime('%Y%m%d%H%M%S%f')[:-3]
+        timestamp_for_filename = _get_current_jst_now().strftime('%Y%m%d%H%M%S%f')[:-3]
+        year, month, day = timestamp_for_filename[:4], timestamp_for_filename[4:6], timestamp_for_filename[6:8]
         image_filename = f"{timestamp_for_filename}_{store_code}.jpg"
         review_base_path = f"review-needed/{year}/{month}/{day}/{store_code}"
         review_image_path = f"{review_base_path}/{image_filename}"
 
         logging.info(f"タイトル不明のため、画像をレビュー用フォルダに保存します: {review_image_path}")
-        _upload_with_logging(image_bytes, review_image_path, 'image/jpeg', 'レビュー用(エラー画像)')
+        jobs = [(_store_image_with_logging, image_bytes, staged_image_path, review_image_path, 'レビュー用(エラー画像)')]
 
         # 処理済み画像がある場合、レビュー用フォルダに追加保存
         if processed_image_bytes:
             processed_image_filename = f"{timestamp_for_filename}_{store_code}_processed.jpg"
             review_processed_image_path = f"{review_base_path}/{processed_image_filename}"
-            _upload_with_logging(processed_image_bytes, review_processed_image_path, 'image/jpeg', 'レビュー用(処理済みエラー画像)')
+            jobs.append((_upload_with_logging, processed_image_bytes, review_processed_image_path, 'image/jpeg', 'レビュー用(処理済みエラー画像)'))
+
+        _run_concurrently(jobs)
 
     except Exception:
         logging.warning("タイトル不明画像の保存中に予期せぬエラーが発生しました。", exc_info=True)
+    finally:
+        if staged_image_path:
+            delete_from_gcs(staged_image_path)
 
 def upload_to_gcs(file_content_bytes: bytes, gcs_filename: str, content_type: str = 'text/csv'):
     """
@@ -125,15 +222,11 @@ def upload_to_gcs(file_content_bytes: bytes, gcs_filename: str, content_type: st
                失敗した場合は (None, error_message)
     """
     try:
-        # GCSクライアントを初期化
-        # Cloud Run環境では、サービスアカウントの権限が自動的に使用される
-        storage_client = storage.Client()
-
-        # 指定されたバケットを取得
-        bucket = storage_client.bucket(config.GCS_BUCKET_NAME)
+        # 指定されたバケットを取得（クライアントとバケットは初回のみ初期化）
+        bucket = _get_bucket()
         
-        # バケットが存在しない場合のハンドリング（
-        if not bucket.exists():
+        # バケットが存在しない場合のハンドリング
+        if bucket is None:
             error_message = f"GCSバケット '{config.GCS_BUCKET_NAME}' が見つかりません。"
             logging.warning(f"エラー: {error_message}")
             return None, error_message
@@ -157,4 +250,39 @@ def upload_to_gcs(file_content_bytes: bytes, gcs_filename: str, content_type: st
     except Exception as e:
         error_message = f"GCSへのアップロード中に予期せぬエラーが発生しました: {e}"
         logging.critical(f"エラー: {error_message}")
-        return None, error_message
\ No newline at end of file
+        return None, error_message
+
+def copy_in_gcs(source_gcs_filename: str, dest_gcs_filename: str):
+    """
+    GCSバケット内のオブジェクトをサーバー側でコピーする（データの再送信は行わない）。
+
+    Returns:
+        tuple: (コピー先のGCSのパス, エラーメッセージ)
+    """
+    try:
+        bucket = _get_bucket()
+        if bucket is None:
+            return None, f"GCSバケット '{config.GCS_BUCKET_NAME}' が見つかりません。"
+        bucket.copy_blob(bucket.blob(source_gcs_filename), bucket, dest_gcs_filename)
+
+        gcs_path = f"gs://{config.GCS_BUCKET_NAME}/{dest_gcs_filename}"
+        logging.info(f"GCS内のコピーが成功しました: {gcs_path}")
+        return gcs_path, None
+
+    except Exception as e:
+        error_message = f"GCS内のコピー中に予期せぬエラーが発生しました: {e}"
+        logging.warning(f"エラー: {error_message}")
+        return None, error_message
+
+def delete_from_gcs(gcs_filename: str):
+    """
+    GCSのオブジェクトを削除する。失敗しても警告ログのみとする。
+    """
+    try:
+        bucket = _get_bucket()
+        if bucket is not None:
+            bucket.blob(gcs_filename).delete()
+    except NotFound:
+        pass
+    except Exception as e:
+        logging.warning(f"GCSオブジェクトの削除に失敗しました: {gcs_filename}, {e}")
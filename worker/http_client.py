@@ -0,0 +1,75 @@
+import os
+import re
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from botocore.config import Config as BotoConfig
+
+# 独自のモジュールをインポート
+from context import trace_id_var
+
+# --- 外部サービス呼び出しで共有するHTTP接続設定 ---
+# 接続プールの大きさ（同時に処理するタスクとI/Oスレッドの合計を賄える程度）
+_POOL_SIZE = 32
+
+# 一時的なエラーとみなして再試行するHTTPステータス
+_RETRY_STATUS_FORCELIST = [429, 500, 502, 503, 504]
+_RETRY_TOTAL = 3
+_RETRY_BACKOFF_FACTOR = 0.5
+
+# W3C Trace Context の trace-id として使える形式（16進数32桁）
+_TRACE_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+def build_traceparent(trace_id: str):
+    """
+    trace_id から W3C Trace Context の traceparent ヘッダー値を生成する。
+    trace_id はUUID形式（ハイフン付き）も受け付け、形式が不正な場合は None を返す。
+    span-id はリクエストごとにランダムに生成する。
+    """
+    normalized = trace_id.replace('-', '').lower() if trace_id else ''
+    if not _TRACE_ID_RE.match(normalized) or normalized == '0' * 32:
+        return None
+    return f"00-{normalized}-{os.urandom(8).hex()}-01"
+
+class _TracingSession(requests.Session):
+    """
+    送信するリクエストに、現在のコンテキストの trace_id を traceparent ヘッダーとして付与するセッション。
+    呼び出し側のコードを変更せずに、外部呼び出しをタスクのトレースと関連付ける。
+    """
+    def prepare_request(self, request):
+        prepared = super().prepare_request(request)
+        if 'traceparent' not in prepared.headers:
+            traceparent = build_traceparent(trace_id_var.get())
+            if traceparent:
+                prepared.headers['traceparent'] = traceparent
+        return prepared
+
+def _create_session() -> requests.Session:
+    """
+    接続プールと再試行を設定した requests.Session を生成する。
+    再試行は冪等なメソッド（GET等）のみ。POST はurllib3の既定により再試行されない。
+    """
+    session = _TracingSession()
+    session.mount('https://', HTTPAdapter(
+        pool_connections=_POOL_SIZE,
+        pool_maxsize=_POOL_SIZE,
+        max_retries=Retry(
+            total=_RETRY_TOTAL,
+            backoff_factor=_RETRY_BACKOFF_FACTOR,
+            status_forcelist=_RETRY_STATUS_FORCELIST,
+            # 再試行が尽きた場合も最後のレスポンスを返し、呼び出し側の raise_for_status で処理する
+            raise_on_status=False
+        )
+    ))
+    return session
+
+# プロセス内で共有するHTTPセッション
+# 呼び出しごとのTCP接続・TLSハンドシェイクを省き、同じホストへの接続を使い回す
+SESSION = _create_session()
+
+# boto3(botocore)クライアント用の設定
+# botocoreは独自の接続プールを持つため、requestsのセッションと同じ大きさ・再試行回数に揃える
+BOTO_CONFIG = BotoConfig(
+    max_pool_connections=_POOL_SIZE,
+    retries={'total_max_attempts': _RETRY_TOTAL + 1, 'mode': 'standard'}
+)
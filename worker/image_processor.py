@@ -1,9 +1,126 @@
 import cv2
 import numpy as np
-import io
 import logging
+import threading
+from multiprocessing import shared_memory
 from typing import Optional, Tuple
-from PIL import Image, ImageOps
+
+# 独自のモジュールをインポート
+import config
+from context import trace_id_var
+
+# 処理全体の作業解像度（長辺の上限, px）。これを超える画像は最初に縮小してから処理する
+# 以下の各カーネルサイズはこの解像度を基準とする
+_WORKING_MAX_DIM = 2000
+# 影除去で背景推定に使う膨張カーネル（呼び出しごとの再生成を避ける）
+_SHADOW_DILATE_KERNEL = np.ones((7, 7), np.uint8)
+# 影除去の背景推定に使う平滑化フィルタのサイズ
+_SHADOW_BLUR_KSIZE = (21, 21)
+# 用紙マスクの縁を削るための収縮カーネル
+_PAPER_ERODE_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (20, 20))
+# OpenCL（Transparent API）が利用可能な環境では影除去をデバイス上で実行する
+_USE_OPENCL = cv2.ocl.haveOpenCL()
+# 出力JPEGのエンコードパラメータ（OCR用途では品質85で十分なため、サイズと処理時間を優先する）
+_JPEG_ENCODE_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1, cv2.IMWRITE_JPEG_PROGRESSIVE, 0]
+# Otsu閾値計算用の輝度値（0〜255）と、OpenCVと同じ判定に使う単精度のイプシロン
+_INTENSITY_LEVELS = np.arange(256, dtype=np.float64)
+_OTSU_EPSILON = float(np.finfo(np.float32).eps)
+# 用紙マスク検出時の長辺の目標サイズ（px）
+_PAPER_MASK_TARGET_SIZE = 1000
+# 方向分析時の長辺の目標サイズ（px）
+_ORIENTATION_TARGET_SIZE = 1600
+# 用紙の高さが幅のこの倍率を超える（明らかに縦長）場合は、90度回転の分析を省略する
+_PORTRAIT_ASPECT_SKIP = 1.2
+
+# 補正不要判定（高速パス）の背景推定に使う中間サイズ・膨張カーネル・最終サイズ
+# 中間サイズで文字を膨張処理で消してから縮小し、照明ムラ（影）の成分だけを残す
+_FAST_PATH_MID_SIZE = (256, 256)
+_FAST_PATH_DILATE_KERNEL = np.ones((9, 9), np.uint8)
+_FAST_PATH_THUMB_SIZE = (64, 64)
+# JPEGのSOIマーカーと、EXIFのOrientationタグ
+_JPEG_SOI = b'\xff\xd8'
+_EXIF_HEADER = b'Exif\x00\x00'
+_EXIF_ORIENTATION_TAG = 0x0112
+
+# 受け付ける画像形式の先頭バイト（マジックナンバー）とMIMEタイプ
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+)
+
+# 中間処理用の作業バッファ（スレッドごとに保持し、同じサイズの画像では再確保しない）
+_scratch = threading.local()
+
+def _scratch_buffer(name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+    """
+    名前ごとの作業バッファを返す。形状・型が異なる場合のみ確保し直す。
+    関数内で完結する中間結果にのみ使い、戻り値として外に出さないこと。
+    """
+    buf = getattr(_scratch, name, None)
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = np.empty(shape, dtype=dtype)
+        setattr(_scratch, name, buf)
+    return buf
+
+def sniff_image_mime_type(image_bytes: bytes) -> Optional[str]:
+    """
+    先頭バイトから画像形式を判定し、MIMEタイプを返す。対応していない形式の場合は None を返す。
+    """
+    for signature, mime_type in _IMAGE_SIGNATURES:
+        if image_bytes[:len(signature)] == signature:
+            return mime_type
+    return None
+
+def _read_jpeg_exif_orientation(image_bytes: bytes) -> Optional[int]:
+    """
+    JPEGのEXIFからOrientationタグの値を読み取る（画像本体はデコードしない）。
+    JPEGでない場合は None、EXIFやタグが無い場合は 1（回転なし）を返す。
+    """
+    if image_bytes[:2] != _JPEG_SOI:
+        return None
+
+    data = memoryview(image_bytes)
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            break
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # マーカー前の埋め草バイト
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):
+            # SOS/EOI 以降にEXIFは存在しない
+            break
+        segment_length = int.from_bytes(data[pos + 2:pos + 4], 'big')
+        if marker == 0xE1 and data[pos + 4:pos + 10] == _EXIF_HEADER:
+            return _parse_tiff_orientation(data[pos + 10:pos + 2 + segment_length])
+        pos += 2 + segment_length
+    return 1
+
+def _parse_tiff_orientation(tiff: memoryview) -> int:
+    """EXIF(TIFF形式)の0th IFDからOrientationタグの値を返す。見つからない場合は 1 を返す。"""
+    if len(tiff) < 8:
+        return 1
+    if tiff[:2] == b'II':
+        byteorder = 'little'
+    elif tiff[:2] == b'MM':
+        byteorder = 'big'
+    else:
+        return 1
+
+    ifd_offset = int.from_bytes(tiff[4:8], byteorder)
+    if ifd_offset + 2 > len(tiff):
+        return 1
+    entry_count = int.from_bytes(tiff[ifd_offset:ifd_offset + 2], byteorder)
+    for i in range(entry_count):
+        entry = ifd_offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        if int.from_bytes(tiff[entry:entry + 2], byteorder) == _EXIF_ORIENTATION_TAG:
+            # SHORT型の値はエントリの値フィールドの先頭2バイトに格納される
+            return int.from_bytes(tiff[entry + 8:entry + 10], byteorder)
+    return 1
 
 # ==========================================
 # 基本ユーティリティクラス：画像処理の原子操作
@@ -25,14 +142,50 @@ class ImageUtils:
             return cv2.rotate(img, cv2.ROTATE_180)
         return img
 
+    @staticmethod
+    def rotate_rect(rect: Tuple[int, int, int, int], img_shape: Tuple[int, int], angle_code: int) -> Tuple[int, int, int, int]:
+        """
+        矩形 (x, y, w, h) を rotate_image と同じ回転に合わせて変換する
+        img_shape は回転前の画像の (高さ, 幅)
+        """
+        x, y, w, h = rect
+        img_h, img_w = img_shape[:2]
+        if angle_code == cv2.ROTATE_90_CLOCKWISE:
+            return img_h - y - h, x, h, w
+        elif angle_code == cv2.ROTATE_180:
+            return img_w - x - w, img_h - y - h, w, h
+        return rect
+
     @staticmethod
     def remove_shadows(gray_img: np.ndarray) -> np.ndarray:
         """影除去アルゴリズム (入力はグレースケール画像である必要がある)"""
-        dilated = cv2.dilate(gray_img, np.ones((7, 7), np.uint8))
-        bg = cv2.medianBlur(dilated, 21)
-        diff = 255 - cv2.absdiff(gray_img, bg)
-        norm = cv2.normalize(diff, None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8UC1)
-        return norm
+        if _USE_OPENCL:
+            return ImageUtils._remove_shadows_umat(gray_img)
+        
+        # 背景推定の中間バッファは作業バッファを使い、以降の処理はdst=で同じバッファに上書きする
+        bg = _scratch_buffer('shadow_bg', gray_img.shape)
+        cv2.dilate(gray_img, _SHADOW_DILATE_KERNEL, dst=bg)
+        # 背景推定は膨張後の低域成分が得られれば十分なため、中央値ではなく
+        # 積分画像で計算できる箱フィルタ（O(1)/画素）で平滑化する
+        cv2.boxFilter(bg, -1, _SHADOW_BLUR_KSIZE, dst=bg, normalize=True, borderType=cv2.BORDER_REPLICATE)
+        cv2.absdiff(gray_img, bg, dst=bg)
+        # 反転も作業バッファ上で行い（飽和減算）、正規化の出力のみ新規に確保して返す
+        cv2.subtract(255, bg, dst=bg)
+        return cv2.normalize(bg, None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8UC1)
+
+    @staticmethod
+    def _remove_shadows_umat(gray_img: np.ndarray) -> np.ndarray:
+        """
+        影除去アルゴリズムのOpenCL版
+        UMatで一連の処理をデバイス上に留め、転送はアップロード・ダウンロード各1回にする
+        """
+        ug = cv2.UMat(gray_img)
+        ubg = cv2.dilate(ug, _SHADOW_DILATE_KERNEL)
+        ubg = cv2.boxFilter(ubg, -1, _SHADOW_BLUR_KSIZE, normalize=True, borderType=cv2.BORDER_REPLICATE)
+        udiff = cv2.absdiff(ug, ubg)
+        udiff = cv2.subtract(255, udiff)
+        unorm = cv2.normalize(udiff, None, alpha=0, beta=255, norm_type=cv2.NORM_MINMAX, dtype=cv2.CV_8UC1)
+        return unorm.get()
 
 # ==========================================
 # コアロジック：分析と検出 (読み取り専用、元画像は変更しない)
@@ -40,42 +193,80 @@ class ImageUtils:
 class DocAnalyzer:
     @staticmethod
     def get_paper_mask(gray_img: np.ndarray) -> np.ndarray:
-        """用紙領域のマスクを取得する"""
+        """
+        用紙領域のマスクを取得する
+        縮小画像上でOtsu二値化と連結成分ラベリングを行い、最大の成分を用紙とみなす
+        """
         h, w = gray_img.shape
-        img_area = h * w
         
-        blurred = cv2.GaussianBlur(gray_img, (21, 21), 0)
-        _, binary = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # 長辺が目標サイズを超える場合のみ縮小し、ぼかしのカーネルも縮小率に合わせる
+        scale = min(1.0, _PAPER_MASK_TARGET_SIZE / max(h, w))
+        if scale < 1.0:
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            small = _scratch_buffer('mask_small', (size[1], size[0]))
+            cv2.resize(gray_img, size, dst=small, interpolation=cv2.INTER_AREA)
+        else:
+            small = _scratch_buffer('mask_small', gray_img.shape)
+            np.copyto(small, gray_img)
+        ksize = max(3, int(21 * scale) | 1)
+        cv2.GaussianBlur(small, (ksize, ksize), 0, dst=small)
+        cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=small)
         
-        mask = np.zeros((h, w), dtype=np.uint8)
+        labels = _scratch_buffer('mask_labels', small.shape, np.int32)
+        n_labels, labels, stats, _ = cv2.connectedComponentsWithStats(small, labels=labels, connectivity=8)
         
-        if not contours:
+        if n_labels <= 1:
             logging.debug("      [Mask] 警告: 輪郭が検出されませんでした。全画面モードに戻ります。")
-            mask[:] = 255 
-            return mask
-
-        max_cnt = max(contours, key=cv2.contourArea)
-        area = cv2.contourArea(max_cnt)
+            return np.full((h, w), 255, dtype=np.uint8)
         
-        if area < img_area * 0.05:
+        # ラベル0は背景のため除外し、面積最大のラベルを選ぶ
+        idx = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+        # 比較結果を0/255のuint8として作業バッファに直接書き込む（bool配列と型変換の中間生成を省く）
+        mask_small = _scratch_buffer('mask_component', small.shape)
+        cv2.compare(labels, idx, cv2.CMP_EQ, dst=mask_small)
+        DocAnalyzer._fill_holes(mask_small)
+        
+        if cv2.countNonZero(mask_small) < small.size * 0.05:
             logging.debug("      [Mask] 警告: 輪郭が小さすぎます (<5%)。認識失敗と判定し、全画面モードに戻ります。")
-            mask[:] = 255
-        else:
-            cv2.drawContours(mask, [max_cnt], -1, 255, -1)
-            kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (20, 20))
-            mask = cv2.erode(mask, kernel, iterations=1)
+            return np.full((h, w), 255, dtype=np.uint8)
         
+        mask = cv2.resize(mask_small, (w, h), interpolation=cv2.INTER_NEAREST)
+        cv2.erode(mask, _PAPER_ERODE_KERNEL, dst=mask, iterations=1)
         return mask
 
     @staticmethod
-    def analyze_orientation_90(gray_img: np.ndarray, mask: np.ndarray) -> Optional[int]:
+    def _fill_holes(mask: np.ndarray) -> None:
+        """
+        マスク内部の穴（文字などで抜けた領域）を塗りつぶす（mask を直接書き換える）
+        外周に1pxの余白を付けて外側から塗りつぶし、届かなかった領域を穴とみなす
+        """
+        padded = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+        cv2.floodFill(padded, None, (0, 0), 255)
+        holes = cv2.bitwise_not(padded[1:-1, 1:-1])
+        cv2.bitwise_or(mask, holes, dst=mask)
+
+    @staticmethod
+    def analyze_orientation_90(gray_img: np.ndarray, mask: np.ndarray, paper_rect: Optional[Tuple[int, int, int, int]] = None) -> Optional[int]:
         """
         90度回転が必要かどうかを分析する
+        paper_rect には用紙マスクの外接矩形 (x, y, w, h) を渡す（省略時はマスクから求める）
         戻り値: (回転が必要な場合の角度コード または None)
         """
         logging.info("  -> [Step 1] 90度回転の特徴を分析中...")
         
+        # 用紙が明らかに縦長なら既に正しい向きとみなし、テキスト特徴の分析を省略する
+        # (横長や正方形に近い場合は従来どおり分析で判定する)
+        # 外接矩形が画像全体と一致する場合（用紙を検出できず全画面マスクに戻った場合など）は、
+        # 縦横比が用紙ではなく撮影画像の向きを表すため、省略せずに分析する
+        if paper_rect is None:
+            paper_rect = cv2.boundingRect(mask)
+        paper_x, paper_y, paper_w, paper_h = paper_rect
+        img_h, img_w = gray_img.shape
+        is_full_frame = (paper_x, paper_y, paper_w, paper_h) == (0, 0, img_w, img_h)
+        if not is_full_frame and paper_h > paper_w * _PORTRAIT_ASPECT_SKIP:
+            logging.debug(f"      [判定] 用紙が縦長 ({paper_w}x{paper_h}) のため、現状を維持します。")
+            return None
+        
         # 前処理: マスク適用とリサイズ
         binary = DocAnalyzer._preprocess_for_orientation(gray_img, mask)
         
@@ -87,12 +278,24 @@ class DocAnalyzer:
 
     @staticmethod
     def _preprocess_for_orientation(gray_img: np.ndarray, mask: np.ndarray) -> np.ndarray:
-        """方向分析用の前処理"""
-        masked_gray = cv2.bitwise_and(gray_img, gray_img, mask=mask)
-        
+        """
+        方向分析用の前処理
+        先に縮小してからマスク適用・二値化を行い、フル解像度での処理を縮小1回に抑える
+        """
         h, w = gray_img.shape
-        scale = 1600.0 / max(h, w)
-        small = cv2.resize(masked_gray, None, fx=scale, fy=scale)
+        scale = _ORIENTATION_TARGET_SIZE / max(h, w)
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        
+        # 縮小時は INTER_AREA、拡大時は従来どおり INTER_LINEAR を使う
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+        small = _scratch_buffer('orientation_small', (size[1], size[0]))
+        cv2.resize(gray_img, size, dst=small, interpolation=interpolation)
+        # マスクは0/255の二値を保つため最近傍で縮小する
+        small_mask = _scratch_buffer('orientation_mask', (size[1], size[0]))
+        cv2.resize(mask, size, dst=small_mask, interpolation=cv2.INTER_NEAREST)
+        
+        # マスクは0/255のみなので、論理積でマスク外を0にできる（縮小バッファ上で上書き）
+        cv2.bitwise_and(small, small_mask, dst=small)
         
         binary = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
                                        cv2.THRESH_BINARY_INV, 25, 10)
@@ -100,28 +303,24 @@ class DocAnalyzer:
 
     @staticmethod
     def _extract_text_orientation_features(binary: np.ndarray) -> Tuple[int, int]:
-        """テキストの方向特徴を抽出 (横書き票数, 縦書き票数)"""
-        contours, _ = cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-        
-        horizontal_votes = 0
-        vertical_votes = 0
-        img_area = binary.shape[0] * binary.shape[1]
-        
-        for cnt in contours:
-            _, _, cw, ch = cv2.boundingRect(cnt)
-            
-            # ノイズフィルタリング
-            if cw * ch < img_area * 0.0005:
-                continue
-            if cw > binary.shape[1] * 0.5 or ch > binary.shape[0] * 0.5:
-                continue
-            
-            aspect_ratio = cw / float(ch)
-            
-            if aspect_ratio > 1.5:
-                horizontal_votes += 1
-            elif aspect_ratio < 0.7:
-                vertical_votes += 1
+        """
+        テキストの方向特徴を抽出 (横書き票数, 縦書き票数)
+        連結成分の統計量（外接矩形）を配列でまとめて取得し、フィルタと投票をNumPyで一括処理する
+        """
+        _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        
+        bin_h, bin_w = binary.shape
+        img_area = bin_h * bin_w
+        # ラベル0は背景のため除外
+        cw = stats[1:, cv2.CC_STAT_WIDTH].astype(np.float32)
+        ch = stats[1:, cv2.CC_STAT_HEIGHT].astype(np.float32)
+        
+        # ノイズフィルタリング
+        keep = (cw * ch >= img_area * 0.0005) & (cw <= bin_w * 0.5) & (ch <= bin_h * 0.5)
+        
+        aspect_ratio = cw[keep] / ch[keep]
+        horizontal_votes = int(np.count_nonzero(aspect_ratio > 1.5))
+        vertical_votes = int(np.count_nonzero(aspect_ratio < 0.7))
         
         logging.debug(f"      [投票] 横書き特徴: {horizontal_votes}, 縦書き特徴: {vertical_votes}")
         return horizontal_votes, vertical_votes
@@ -142,12 +341,30 @@ class DocAnalyzer:
         return None
 
     @staticmethod
-    def analyze_upside_down_180(gray_img: np.ndarray, mask: np.ndarray) -> Optional[int]:
-        """180度回転（逆さま）が必要かどうかを分析する"""
+    def background_stddev(gray_img: np.ndarray, mask: np.ndarray) -> float:
+        """
+        用紙領域内の背景（照明）の明るさのばらつき（標準偏差）を返す
+        縮小画像を膨張処理して文字を消し、残った照明ムラ（影）だけを評価する
+        """
+        small = cv2.resize(gray_img, _FAST_PATH_MID_SIZE, interpolation=cv2.INTER_AREA)
+        cv2.dilate(small, _FAST_PATH_DILATE_KERNEL, dst=small)
+        background = cv2.resize(small, _FAST_PATH_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        thumb_mask = cv2.resize(mask, _FAST_PATH_THUMB_SIZE, interpolation=cv2.INTER_NEAREST)
+        if not cv2.countNonZero(thumb_mask):
+            return float('inf')
+        _, stddev = cv2.meanStdDev(background, mask=thumb_mask)
+        return float(stddev[0, 0])
+
+    @staticmethod
+    def analyze_upside_down_180(clean_img: np.ndarray, paper_rect: Tuple[int, int, int, int]) -> Optional[int]:
+        """
+        180度回転（逆さま）が必要かどうかを分析する
+        clean_img には影除去済みの画像を、paper_rect には用紙マスクの外接矩形 (x, y, w, h) を渡す
+        """
         logging.info("  -> [Step 2] 180度回転の特徴を分析中...")
         
         # ROI領域の計算
-        roi_top, roi_bottom = DocAnalyzer._extract_top_bottom_rois(gray_img, mask)
+        roi_top, roi_bottom = DocAnalyzer._extract_top_bottom_rois(clean_img, paper_rect)
         
         if roi_top is None or roi_bottom is None:
             return None
@@ -165,37 +382,54 @@ class DocAnalyzer:
         return None
 
     @staticmethod
-    def _extract_top_bottom_rois(gray_img: np.ndarray, mask: np.ndarray) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
-        """上部と下部のROI領域を抽出"""
-        y_indices, x_indices = np.where(mask > 0)
-        if len(y_indices) == 0:
+    def _extract_top_bottom_rois(img: np.ndarray, paper_rect: Tuple[int, int, int, int]) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """上部と下部のROI領域を抽出 (paper_rect は用紙マスクの外接矩形)"""
+        x_min, y_min, rect_w, rect_h = paper_rect
+        if rect_w == 0 or rect_h == 0:
             return None, None
         
-        y_min, y_max = np.min(y_indices), np.max(y_indices)
-        x_min, x_max = np.min(x_indices), np.max(x_indices)
+        # 最大座標は矩形内の最後の画素（両端を含む）とする
+        x_max, y_max = x_min + rect_w - 1, y_min + rect_h - 1
         h, w = y_max - y_min, x_max - x_min
         
         safe_margin_y = int(h * 0.05)
         safe_margin_x = int(w * 0.1)
         roi_h_size = int(h * 0.45)
         
-        roi_top = gray_img[y_min + safe_margin_y : y_min + safe_margin_y + roi_h_size, 
+        roi_top = img[y_min + safe_margin_y : y_min + safe_margin_y + roi_h_size, 
                            x_min + safe_margin_x : x_max - safe_margin_x]
         
-        roi_bottom = gray_img[y_max - safe_margin_y - roi_h_size : y_max - safe_margin_y, 
+        roi_bottom = img[y_max - safe_margin_y - roi_h_size : y_max - safe_margin_y, 
                               x_min + safe_margin_x : x_max - safe_margin_x]
         
         return roi_top, roi_bottom
 
     @staticmethod
     def _calculate_ink_density(roi: np.ndarray) -> int:
-        """ROI領域のインク濃度を計算"""
+        """
+        ROI領域のインク濃度を計算 (ROIは影除去済みであること)
+        Otsu二値化 (THRESH_BINARY_INV) 後の非ゼロ画素数をヒストグラムから直接求め、二値画像の生成を省く
+        """
         if roi.size == 0:
             return 0
         
-        clean = ImageUtils.remove_shadows(roi)
-        _, binary = cv2.threshold(clean, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        return cv2.countNonZero(binary)
+        hist = cv2.calcHist([roi], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+        
+        # cv2.threshold の Otsu 実装と同じ式でクラス間分散を全閾値について一括計算する
+        p = hist / roi.size
+        q1 = np.cumsum(p)
+        q2 = 1.0 - q1
+        m1 = np.cumsum(_INTENSITY_LEVELS * p)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mu1 = m1 / q1
+            mu2 = (m1[-1] - m1) / q2
+            sigma = q1 * q2 * (mu1 - mu2) ** 2
+        valid = (np.minimum(q1, q2) >= _OTSU_EPSILON) & (np.maximum(q1, q2) <= 1.0 - _OTSU_EPSILON)
+        sigma = np.where(valid, sigma, 0.0)
+        thresh = int(np.argmax(sigma)) if sigma.max() > 0 else 0
+        
+        # BINARY_INV では閾値以下の画素がインクとして残る
+        return int(hist[:thresh + 1].sum())
 
 
 def process_image(image_bytes: bytes) -> bytes:
@@ -211,36 +445,59 @@ def process_image(image_bytes: bytes) -> bytes:
     logging.info("画像処理を開始します (回転補正 & 影除去)...")
     
     try:
-        # EXIF修正とOpenCV形式への変換
-        pil_img = Image.open(io.BytesIO(image_bytes))
-        pil_img = ImageOps.exif_transpose(pil_img)
-        current_color = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-        
-        # グレースケール変換
-        current_gray = ImageUtils.to_gray(current_color)
+        # デコード前にEXIFの回転情報だけを確認しておく（高速パスの判定に使用）
+        exif_orientation = _read_jpeg_exif_orientation(image_bytes)
+
+        # 以降の処理と出力はすべてグレースケールのため、カラーは展開せず直接グレースケールでデコードする
+        # （EXIFの回転情報は imdecode が適用する）
+        current_gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if current_gray is None:
+            raise ValueError("画像データのデコードに失敗しました。")
+        
+        # 作業解像度を上限で抑え、以降の全ステージの処理量とカーネルの実効サイズを入力サイズに依存させない
+        # (出力もこの解像度のままとし、アップロード量も削減する)
+        h, w = current_gray.shape
+        is_resized = max(h, w) > _WORKING_MAX_DIM
+        if is_resized:
+            scale = _WORKING_MAX_DIM / max(h, w)
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            current_gray = cv2.resize(current_gray, size, interpolation=cv2.INTER_AREA)
         
         # Stage 1: 90度補正
         mask = DocAnalyzer.get_paper_mask(current_gray)
-        rotate_cmd = DocAnalyzer.analyze_orientation_90(current_gray, mask)
+        # 以降のマスクの用途は縦横比の判定と外接矩形のみのため、回転時もマスク画像ではなく矩形を回転させる
+        paper_rect = cv2.boundingRect(mask)
+        rotate_cmd = DocAnalyzer.analyze_orientation_90(current_gray, mask, paper_rect)
         
         if rotate_cmd is not None:
-            current_color = ImageUtils.rotate_image(current_color, rotate_cmd)
+            paper_rect = ImageUtils.rotate_rect(paper_rect, current_gray.shape, rotate_cmd)
             current_gray = ImageUtils.rotate_image(current_gray, rotate_cmd)
-            mask = ImageUtils.rotate_image(mask, rotate_cmd)
         
-        # Stage 2: 180度補正
-        rotate_cmd_180 = DocAnalyzer.analyze_upside_down_180(current_gray, mask)
+        # 高速パス: 元画像がそのまま使える場合は影除去と再エンコードを省略し、元のバイト列を返す
+        # (回転情報を持たない作業解像度内のJPEGで、90度回転が不要かつ照明ムラが小さいもの)
+        if rotate_cmd is None and not is_resized and exif_orientation == 1:
+            bg_stddev = DocAnalyzer.background_stddev(current_gray, mask)
+            if bg_stddev < config.IMAGE_FAST_PATH_MAX_BG_STDDEV:
+                # 照明ムラが小さいため、180度判定は影除去前の画像で行う
+                if DocAnalyzer.analyze_upside_down_180(current_gray, paper_rect) is None:
+                    logging.info(f"  -> 補正不要と判定しました (背景の標準偏差: {bg_stddev:.2f})。元画像をそのまま使用します。")
+                    return image_bytes
         
-        if rotate_cmd_180 is not None:
-            current_color = ImageUtils.rotate_image(current_color, rotate_cmd_180)
+        # 影除去は全体に対して一度だけ行い、180度判定のROIと最終出力の両方で共有する
+        clean_full = ImageUtils.remove_shadows(current_gray)
+        
+        # Stage 2: 180度補正
+        rotate_cmd_180 = DocAnalyzer.analyze_upside_down_180(clean_full, paper_rect)
         
-        # Stage 3: 影除去
+        # Stage 3: 影除去済み画像の向きを確定
+        # (影除去のフィルタは上下左右に対称なため、回転前に処理しても結果は同じ)
         logging.info("  -> [Step 3] 最終処理中 (影除去)...")
-        final_gray = ImageUtils.to_gray(current_color)
-        final_output = ImageUtils.remove_shadows(final_gray)
+        if rotate_cmd_180 is not None:
+            clean_full = ImageUtils.rotate_image(clean_full, rotate_cmd_180)
+        final_output = clean_full
         
         # JPEG エンコード
-        success, buffer = cv2.imencode('.jpg', final_output)
+        success, buffer = cv2.imencode('.jpg', final_output, _JPEG_ENCODE_PARAMS)
         if not success:
             logging.error("処理済み画像のエンコードに失敗しました。")
             return image_bytes
@@ -249,4 +506,30 @@ def process_image(image_bytes: bytes) -> bytes:
     
     except Exception as e:
         logging.error(f"画像処理中にエラーが発生しました: {e}", exc_info=True)
-        return image_bytes
\ No newline at end of file
+        return image_bytes
+
+def init_worker_process():
+    """
+    画像の前処理を実行する子プロセスの初期化処理。
+    子プロセスでも親プロセスと同じ形式でログを出力できるようにする。
+    """
+    import logger_config
+    logger_config.configure_logging()
+
+def process_shared_image(shm_name: str, size: int, trace_id: str) -> Optional[bytes]:
+    """
+    親プロセスが共有メモリに書き込んだ画像を、子プロセス上で process_image により処理する。
+    画像のバイト列をプロセス間でコピーせず、共有メモリの名前だけを受け渡す。
+    元画像をそのまま使う場合（高速パス・エラー時）は None を返し、呼び出し元は手元の元画像を使う。
+    """
+    # 呼び出し元の trace_id をログに引き継ぐ
+    trace_id_var.set(trace_id)
+    # 共有メモリの作成・削除は親プロセスが管理する（spawnの子プロセスは親とリソーストラッカーを共有する）
+    shm = shared_memory.SharedMemory(name=shm_name)
+    view = shm.buf[:size]
+    try:
+        result = process_image(view)
+        return None if result is view else result
+    finally:
+        view.release()
+        shm.close()
@@ -1,6 +1,7 @@
 # lineworks_api.py
 import requests
 import jwt
+from cryptography.hazmat.primitives import serialization
 import time
 import json
 import base64
@@ -13,35 +14,83 @@ import logging
 
 # 配置pyをインポート
 import config
+import http_client
+from ttl_cache import TTLCache
+
+# ユーザーID（UUID形式）の判定パターン。これに一致しない宛先はチャンネルIDとして扱う
+_USER_ID_RE = re.compile(r'^[a-f0-9]{8}-(?:[a-f0-9]{4}-){3}[a-f0-9]{12}$')
+# UUID形式の文字列長（正規表現の前に長さで絞り込む）
+_USER_ID_LENGTH = 36
+
+# --- ユーザー・組織情報のキャッシュ ---
+# 店舗コードの所属変更は画像処理の時間スケールではほぼ起きないため、
+# 解決済みの userId -> 店舗コード と、複数ユーザーで共有される組織情報をTTL付きで保持する
+_store_code_cache = TTLCache(maxsize=config.STORE_CODE_CACHE_MAXSIZE, ttl=config.STORE_CODE_CACHE_TTL)
+_org_unit_cache = TTLCache(maxsize=config.ORG_UNIT_CACHE_MAXSIZE, ttl=config.ORG_UNIT_CACHE_TTL)
+
+# --- HTTP セッション ---
+# LINE WORKS API への接続は他の外部呼び出しと共有するセッションで使い回し、
+# 呼び出しごとのTCP/TLSハンドシェイクを省く（接続プール・再試行の設定は http_client を参照）
+_session = http_client.SESSION
 
 # --- Access Token 管理 ---
 _cached_token = None
 _token_expiry_time = 0
 _token_lock = threading.Lock()
 
+# Private Key はプロセス内で不変のため、初回読み込み時に鍵オブジェクトまで変換して保持する
+# （PyJWT に鍵オブジェクトを渡すことで、署名のたびのPEM解析を省く）
+_private_key = None
+
+# トークン取得に使ったJWTのキャッシュ（有効期限まで再利用し、RS256署名を省く）
+_cached_jwt = None
+_jwt_expiry_time = 0
+
+def _get_private_key():
+    """
+    Service Account の Private Key を取得する（初回のみファイルから読み込む）。
+    ファイルが存在しない場合は FileNotFoundError を送出する。
+    """
+    global _private_key
+    if _private_key is None:
+        with open(config.SA_PRIVATE_KEY_PATH, 'rb') as f:
+            _private_key = serialization.load_pem_private_key(f.read(), password=None)
+    return _private_key
+
+def _get_jwt():
+    """
+    Access Token 取得用のJWTを返す。
+    前回生成したJWTの有効期限まで余裕があればそれを再利用する。
+    """
+    global _cached_jwt, _jwt_expiry_time
+    now = time.time()
+    if _cached_jwt and now < _jwt_expiry_time - config.JWT_REUSE_BUFFER:
+        return _cached_jwt
+
+    iat = int(now)
+    # JWTの有効期限が長くなるとセキュリティに支障が出る可能性あり
+    exp = iat + config.JWT_EXPIRY
+
+    payload = {
+        'iss': config.SA_CLIENT_ID,
+        'sub': config.SA_SERVICE_ACCOUNT,
+        'iat': iat,
+        'exp': exp,
+        'scope': config.SA_SCOPES
+    }
+
+    _cached_jwt = jwt.encode(payload, _get_private_key(), algorithm='RS256')
+    _jwt_expiry_time = exp
+    return _cached_jwt
+
 def generate_new_access_token():
     """Service Account JWTを用いて新たなAccess Token"""
     global _cached_token, _token_expiry_time
     logging.info("新しい Access Token を取得中...")
     try:
-        with open(config.SA_PRIVATE_KEY_PATH, 'r') as f:
-            private_key = f.read()
-
-        iat = int(time.time())
-        # JWTの有効期限が長くなるとセキュリティに支障が出る可能性あり
-        exp = iat + 300 # JWT 有効期限 5分
-
-        payload = {
-            'iss': config.SA_CLIENT_ID,
-            'sub': config.SA_SERVICE_ACCOUNT,
-            'iat': iat,
-            'exp': exp,
-            'scope': config.SA_SCOPES
-        }
+        jwt_token = _get_jwt()
 
-        jwt_token = jwt.encode(payload, private_key, algorithm='RS256')
-
-        response = requests.post(
+        response = _session.post(
             config.LINEWORKS_TOKEN_URL,
             headers={'Content-Type': 'application/x-www-form-urlencoded'},
             data={
@@ -114,7 +163,7 @@ def get_user_info(user_id):
     try:
         headers = get_lw_api_headers(include_content_type=False)
         logging.info(f"ユーザー情報取得 API 呼び出し開始: userId={user_id}")
-        response = requests.get(url, headers=headers, timeout=30)
+        response = _session.get(url, headers=headers, timeout=30)
         response.raise_for_status() # 2xx以外のステータスコードで例外を発生させる
         return response.json(), None
     except ValueError as e:
@@ -134,13 +183,20 @@ def get_org_unit_info(org_unit_id):
     if not org_unit_id:
         return None, "org_unit_idが指定されていません。"
 
+    cached = _org_unit_cache.get(org_unit_id)
+    if cached is not None:
+        logging.info(f"組織情報をキャッシュから取得: orgUnitId={org_unit_id}")
+        return cached, None
+
     url = f"{config.LINEWORKS_API_BASE}/orgunits/{org_unit_id}"
     try:
         headers = get_lw_api_headers(include_content_type=False)
         logging.info(f"組織情報取得 API 呼び出し開始: orgUnitId={org_unit_id}")
-        response = requests.get(url, headers=headers, timeout=30)
+        response = _session.get(url, headers=headers, timeout=30)
         response.raise_for_status()
-        return response.json(), None
+        org_unit_info = response.json()
+        _org_unit_cache.set(org_unit_id, org_unit_info)
+        return org_unit_info, None
     except ValueError as e:
         return None, f"組織情報取得のためのAccess Token取得失敗: {e}"
     except requests.exceptions.RequestException as e:
@@ -151,6 +207,54 @@ def get_org_unit_info(org_unit_id):
         return None, error_message
 
 
+# ストリーミングダウンロード時のチャンクサイズ
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class AttachmentTooLargeError(Exception):
+    """添付ファイルのサイズが許容される上限を超えている。"""
+
+def _read_streamed_content(response, max_bytes: int):
+    """
+    stream=True のレスポンス本文をチャンク単位で読み込み、bytesとして返す。
+    Content-Length が分かる場合は事前確保したバッファに直接書き込み、チャンクの一時リストと結合コピーを省く。
+    本文が max_bytes を超える場合は、全体を読み込む（メモリを確保する）前に AttachmentTooLargeError を送出する。
+    """
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise AttachmentTooLargeError(f"Content-Length {content_length} exceeds {max_bytes} bytes")
+
+    chunks = response.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE)
+    # 圧縮転送の場合、Content-Length は展開後のサイズと一致しないため事前確保しない
+    if content_length and content_length.isdigit() and not response.headers.get('Content-Encoding'):
+        buf = bytearray(int(content_length))
+        offset = 0
+        overflow = None
+        with memoryview(buf) as view:
+            for chunk in chunks:
+                end = offset + len(chunk)
+                if end > len(buf):
+                    # 申告より大きい場合は、残りを通常の追記で読み込む
+                    overflow = chunk
+                    break
+                view[offset:end] = chunk
+                offset = end
+        # 申告より小さい場合は未使用の末尾を切り詰める
+        del buf[offset:]
+        if overflow is None:
+            return bytes(buf)
+        buf.extend(overflow)
+    else:
+        buf = bytearray()
+
+    for chunk in chunks:
+        # Content-Length がない・申告と異なる場合も、上限を超えた時点で読み込みを打ち切る
+        if len(buf) > max_bytes:
+            break
+        buf.extend(chunk)
+    if len(buf) > max_bytes:
+        raise AttachmentTooLargeError(f"Body exceeds {max_bytes} bytes")
+    return bytes(buf)
+
 def download_lw_attachment(file_id):
     """LINE WORKS から添付ファイルの内容をダウンロード（302 を手動で処理し、2 回目のステップで認証情報を含む）"""
     if not file_id: return None, "fileId is missing"
@@ -158,7 +262,7 @@ def download_lw_attachment(file_id):
     try:
         headers_step1 = get_lw_api_headers(include_content_type=False)
         logging.info(f"ダウンロードリダイレクトURL取得 API 呼び出し開始: fileId={file_id}")
-        response_initial = requests.get(initial_url, headers=headers_step1, timeout=30, allow_redirects=False)
+        response_initial = _session.get(initial_url, headers=headers_step1, timeout=30, allow_redirects=False)
 
         if response_initial.status_code == 302:
             download_url = response_initial.headers.get('Location')
@@ -166,10 +270,11 @@ def download_lw_attachment(file_id):
             logging.info(f"リダイレクトURL取得成功: {download_url}")
             logging.info(f"実際のダウンロード開始 (Authorization ヘッダ付き): {download_url}")
             headers_step2 = {'Authorization': headers_step1['Authorization']}
-            response_content = requests.get(download_url, headers=headers_step2, timeout=120)
-            response_content.raise_for_status()
+            with _session.get(download_url, headers=headers_step2, timeout=120, stream=True) as response_content:
+                response_content.raise_for_status()
+                content = _read_streamed_content(response_content, config.MAX_IMAGE_BYTES)
             logging.info(f"実際のダウンロード成功: fileId={file_id}, Content-Type={response_content.headers.get('Content-Type')}")
-            return response_content.content, None
+            return content, None
         else:
             error_message = f"ダウンロードURLの取得に失敗しました。Status: {response_initial.status_code}"
             try: error_message += f", Body: {response_initial.text}"
@@ -177,6 +282,10 @@ def download_lw_attachment(file_id):
             logging.error(f"エラー: {error_message}")
             if response_initial.status_code == 401: return None, "アクセストークンが無効か、このAPIを呼び出す権限（Scope）がありません。"
             return None, error_message
+    except AttachmentTooLargeError:
+        # 再試行しても結果は変わらないため、通常のダウンロード失敗と区別できるよう呼び出し元に送出する
+        logging.warning(f"添付ファイルのサイズが上限を超えたため、ダウンロードを中止しました: fileId={file_id}")
+        raise
     except ValueError as e: return None, f"Access Token 取得失敗: {e}"
     except requests.exceptions.RequestException as e:
         logging.error(f"エラー: 添付ファイルのダウンロード処理中にエラー: {e}")
@@ -192,7 +301,7 @@ def upload_lw_attachment(filename, file_content_bytes):
     try:
         headers_step1 = get_lw_api_headers()
         logging.info(f"アップロードURL取得 API 呼び出し開始: filename={filename}")
-        response_step1 = requests.post(step1_url, headers=headers_step1, data=step1_payload, timeout=30)
+        response_step1 = _session.post(step1_url, headers=headers_step1, data=step1_payload, timeout=30)
         response_step1.raise_for_status()
         result_step1 = response_step1.json()
         file_id = result_step1.get('fileId')
@@ -211,7 +320,7 @@ def upload_lw_attachment(filename, file_content_bytes):
         access_token = get_valid_access_token()
         if not access_token: return None, "Step 2 Access Token 取得失敗"
         headers_step2 = {'Authorization': f'Bearer {access_token}'}
-        response_step2 = requests.post(upload_url, headers=headers_step2, files=files_param, timeout=120)
+        response_step2 = _session.post(upload_url, headers=headers_step2, files=files_param, timeout=120)
         response_step2.raise_for_status()
         logging.info(f"実際のファイルアップロード成功: fileId={file_id}")
         return file_id, None
@@ -230,13 +339,13 @@ def upload_lw_attachment(filename, file_content_bytes):
 def send_lw_message(recipient_id, content_payload):
     """ユーザーまたはチャンネルにメッセージを送信"""
     if not recipient_id: return "recipient_id is missing"
-    is_user = bool(re.match(r'^[a-f0-9]{8}-([a-f0-9]{4}-){3}[a-f0-9]{12}$', recipient_id))
+    is_user = len(recipient_id) == _USER_ID_LENGTH and _USER_ID_RE.match(recipient_id) is not None
     if is_user: url = f"{config.LINEWORKS_API_BASE}/bots/{config.LINEWORKS_BOT_ID}/users/{recipient_id}/messages"
     else: url = f"{config.LINEWORKS_API_BASE}/bots/{config.LINEWORKS_BOT_ID}/channels/{recipient_id}/messages"
     try:
         headers = get_lw_api_headers()
         logging.info(f"メッセージ送信 API 呼び出し開始: recipient={recipient_id}, content type={content_payload.get('content',{}).get('type')}")
-        response = requests.post(url, headers=headers, json=content_payload, timeout=60)
+        response = _session.post(url, headers=headers, json=content_payload, timeout=60)
         response.raise_for_status()
         logging.info(f"メッセージ送信 API 成功: recipient={recipient_id}")
         return None
@@ -248,10 +357,22 @@ def send_lw_message(recipient_id, content_payload):
         logging.error(f"エラー: メッセージ送信中に予期せぬエラー: {e}")
         return f"メッセージ送信中に予期せぬエラーが発生しました: {e}"
 
+def get_cached_store_code(user_id):
+    """
+    キャッシュ済みの店舗コードを返す。キャッシュに無い場合は None を返す（APIは呼び出さない）。
+    """
+    return _store_code_cache.get(user_id)
+
 def get_store_code_by_user(user_id):
     """
     ユーザーIDから所属組織の店舗コード（組織のdescription）を取得する。
+    取得に成功した店舗コードはキャッシュし、同一ユーザーの再取得ではAPIを呼び出さない。
     """
+    store_code = _store_code_cache.get(user_id)
+    if store_code is not None:
+        logging.info(f"店舗コードをキャッシュから取得: userId={user_id}")
+        return store_code, None
+
     logging.info(f"ユーザー情報の取得を開始: userId={user_id}")
     user_info, err = get_user_info(user_id)
     if err: return None, f"ユーザー情報の取得に失敗しました: {err}"
@@ -267,5 +388,6 @@ def get_store_code_by_user(user_id):
         
     store_code = org_unit_info.get('description')
     if not store_code: return None, "組織情報に店舗コードが設定されていません。"
-        
+
+    _store_code_cache.set(user_id, store_code)
     return store_code, None
\ No newline at end of file
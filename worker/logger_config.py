@@ -1,45 +1,88 @@
 # logger_config.py
 
 import logging
-from google.cloud.logging.handlers import CloudLoggingHandler, setup_logging
-import google.cloud.logging
+import sys
+import orjson
 
 # 独自のモジュールをインポート
 import config
-from context import trace_id_var 
+from context import trace_id_var
 
 class CloudTraceFilter(logging.Filter):
     """
     ログレコードに、Google Cloud Loggingがネイティブに認識する
     'trace'フィールドと、検索用の'traceId'フィールドを追加するフィルター。
+    プロジェクトIDは生成時に受け取る（config の値はシークレットとして遅延取得され、
+    取得時のログ出力がこのフィルターを再帰的に呼び出さないようにするため）。
     """
+    def __init__(self, project_id: str):
+        super().__init__()
+        self.project_id = project_id
+
     def filter(self, record):
         trace_id = trace_id_var.get()
-        record.trace = f"projects/{config.GCP_PROJECT_ID}/traces/{trace_id}"
-        
+        # 外部呼び出しの traceparent ヘッダーと同じ形式（ハイフンなしの16進数32桁）に揃える
+        record.trace = f"projects/{self.project_id}/traces/{trace_id.replace('-', '')}"
+
         # jsonPayloadに独立したフィールドとして追加
         record.json_fields = {
             "traceId": trace_id
         }
         return True
 
+class StructuredJsonFormatter(logging.Formatter):
+    """
+    ログレコードを、Cloud Runの標準出力からCloud Loggingが構造化ログとして取り込める
+    1行のJSONに変換するフォーマッター。エンコードには orjson を使用する。
+    """
+    def format(self, record):
+        message = record.getMessage()
+        # スタックトレースはメッセージに含め、Error Reportingが検出できるようにする
+        if record.exc_info:
+            message = f"{message}\n{self.formatException(record.exc_info)}"
+        elif record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+
+        payload = {
+            "severity": record.levelname,
+            "message": message,
+            "timestamp": {"seconds": int(record.created), "nanos": int((record.created % 1) * 1e9)},
+            "logger": record.name,
+            "logging.googleapis.com/sourceLocation": {
+                "file": record.pathname,
+                "line": record.lineno,
+                "function": record.funcName,
+            },
+        }
+        trace = getattr(record, "trace", None)
+        if trace:
+            payload["logging.googleapis.com/trace"] = trace
+        json_fields = getattr(record, "json_fields", None)
+        if json_fields:
+            payload.update(json_fields)
+
+        # シリアライズできない値は文字列として出力する
+        return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
 def configure_logging():
     """
-    CloudLoggingHandlerと公式のヘルパー関数を使用して、
-    構造化ロギングとネイティブなTraceIDの付与を設定する。
+    標準出力へのJSON構造化ロギングとネイティブなTraceIDの付与を設定する。
+    Cloud Runは標準出力の1行のJSONを構造化ログとして取り込むため、
+    ログの送信をAPI経由で行わず、エンコードも orjson で高速に行う。
     """
-    client = google.cloud.logging.Client()
-    
     # ハンドラを作成
-    handler = CloudLoggingHandler(client, name="bot-ocr-worker")
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(StructuredJsonFormatter())
 
     # フィルターをハンドラに追加
-    handler.addFilter(CloudTraceFilter())
-    
-    # ハンドラをロガーに設定
-    setup_logging(handler)
-    
+    handler.addFilter(CloudTraceFilter(config.GCP_PROJECT_ID))
+
+    # ハンドラをルートロガーに設定（既存のハンドラは置き換える）
+    root_logger = logging.getLogger()
+    root_logger.handlers.clear()
+    root_logger.addHandler(handler)
+
     # アプリケーション全体のログレベルを設定
-    logging.getLogger().setLevel(logging.INFO)
+    root_logger.setLevel(logging.INFO)
 
-    print("構造化ロギングが設定されました（公式ヘルパー関数使用）。")
\ No newline at end of file
+    print("構造化ロギングが設定されました（標準出力へのJSON出力）。")
@@ -9,6 +9,7 @@ from context import trace_id_var
 
 # 独自のモジュールをインポート
 import tasks
+from errors import TaskError
 import logger_config 
 
 # Flaskアプリケーションを作成する前に、ロギングを最初に設定する
@@ -26,7 +27,7 @@ def worker_endpoint():
     
     # acceptorから渡されたtrace_idを取得、なければ新規作成
     # これにより、リクエストのライフサイクル全体を追跡できる
-    trace_id = task_data.get('trace_id', str(uuid.uuid4()))
+    trace_id = task_data.get('trace_id', uuid.uuid4().hex)
     trace_id_var.set(trace_id)
 
     # ログにtrace_idを含めることで、検索やフィルタリングが容易になる
@@ -55,6 +56,15 @@ def worker_endpoint():
         # Cloud Tasksに成功を通知
         return "Task completed successfully", 200
 
+    except TaskError as e:
+        if not e.retryable:
+            # 再試行しても結果が変わらないエラー（不正なファイル・読み取れない帳票など）は、
+            # ユーザーへの通知は済んでいるため、成功を返してCloud Tasksによる再試行を止める
+            logging.error(f"再試行不可能なエラー: {e} タスクを再試行せずに終了します。", exc_info=True)
+            return f"Task failed permanently: {e}", 200
+        logging.error(f"再試行可能なエラー: {e} タスクを失敗としてマークします。", exc_info=True)
+        return f"Task failed: {e}", 400
+
     except Exception as e:
         # tasks.process_image_and_replyの内部で発生したすべての例外を捕捉する。
         # このブロックに来た時点で「タスク失敗」が確定。
@@ -64,5 +74,7 @@ def worker_endpoint():
         return f"Task failed: {e}", 400
 
 if __name__ == '__main__':
+    # ローカル開発用の起動。本番はProcfileのgunicornから起動する
+    # デバッガとリローダーは FLASK_DEBUG=1 の場合のみ有効にする（debug未指定時はFlaskが環境変数を参照する）
     port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -1,9 +1,48 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import NoCredentialsError, ClientError
+import io
 import logging
+import threading
 
 # 独自のモジュールをインポート
 import config
+import http_client
+
+# マルチパートアップロードの設定
+# 1MBを超えるファイルは1MBごとのパートに分割し、最大4並列でアップロードする
+# (CSVなどの小さなファイルは従来通り1回のPUTで送信される)
+_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=1 * 1024 * 1024,
+    multipart_chunksize=1 * 1024 * 1024,
+    max_concurrency=4,
+    use_threads=True
+)
+
+# クライアントインスタンスをキャッシュするグローバル変数（遅延初期化用）
+# boto3クライアントの生成は重く、接続プールもクライアント単位のため、プロセス内で使い回す
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    """
+    S3クライアントのシングルトンを取得する。
+    初回呼び出し時のみ初期化を行う（遅延ロード）。
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # configから認証情報とリージョンを読み込む
+                _client = boto3.client(
+                    's3',
+                    aws_access_key_id=config.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
+                    region_name=config.AWS_S3_REGION,
+                    # 接続プール・再試行の設定は他の外部呼び出しと揃える
+                    config=http_client.BOTO_CONFIG
+                )
+    return _client
 
 def upload_to_s3(file_content_bytes: bytes, s3_filename: str, content_type: str = 'text/csv'):
     """
@@ -20,22 +59,17 @@ def upload_to_s3(file_content_bytes: bytes, s3_filename: str, content_type: str
                失敗した場合は (None, error_message)
     """
     try:
-        # S3クライアントを初期化
-        # configから認証情報とリージョンを読み込む
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=config.AWS_SECRET_ACCESS_KEY,
-            region_name=config.AWS_S3_REGION
-        )
+        # S3クライアントを取得（初回のみ初期化）
+        s3_client = _get_client()
         logging.info(f"S3へのアップロードを開始: s3://{config.AWS_S3_BUCKET_NAME}/{s3_filename}")
 
-        # メモリから直接データをアップロード
-        s3_client.put_object(
-            Bucket=config.AWS_S3_BUCKET_NAME,
-            Key=s3_filename,
-            Body=file_content_bytes,
-            ContentType=content_type
+        # メモリから直接データをアップロード（サイズに応じてマルチパートで並列送信）
+        s3_client.upload_fileobj(
+            io.BytesIO(file_content_bytes),
+            config.AWS_S3_BUCKET_NAME,
+            s3_filename,
+            ExtraArgs={'ContentType': content_type},
+            Config=_TRANSFER_CONFIG
         )
 
         s3_path = f"s3://{config.AWS_S3_BUCKET_NAME}/{s3_filename}"
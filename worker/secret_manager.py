@@ -1,19 +1,53 @@
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.api_core import exceptions
 from google.cloud import secretmanager
 import logging
 
+from ttl_cache import TTLCache
+
 # ロガーを取得
 logger = logging.getLogger(__name__)
 
 # クライアントインスタンスをキャッシュするグローバル変数（遅延初期化用）
 _client = None
 
-# API呼び出し頻度を減らすためのキャッシュ
-_secret_cache = {}
+# API呼び出し頻度を減らすためのTTL付きLRUキャッシュ
+# シークレットのローテーションに追従できるよう、一定時間で再取得する
+_secret_cache = TTLCache(maxsize=64, ttl=3600)
 
 # フォールバック用のプロジェクトID（Cloud Runの環境変数が設定されていない場合に使用）
 _FALLBACK_PROJECT_ID = 'sunny-resolver-460603-m3'
 
+# 一括取得時の最大並列数
+_PREFETCH_MAX_WORKERS = 8
+
+# Secret Manager呼び出しのリトライ設定（指数バックオフ + ジッター）
+_RETRY_MAX_ATTEMPTS = 3
+_RETRY_BASE_DELAY = 0.1 # 秒
+_RETRY_MAX_DELAY = 2.0 # 秒
+# 一時的な障害とみなしてリトライするエラー
+_RETRYABLE_ERRORS = (
+    exceptions.ServiceUnavailable,
+    exceptions.DeadlineExceeded,
+    exceptions.InternalServerError,
+    exceptions.TooManyRequests,
+)
+
+def _call_with_retry(func, *args, **kwargs):
+    """
+    一時的なエラーが発生した場合に、指数バックオフ + ジッター(Full Jitter)で関数呼び出しをリトライする。
+    """
+    for attempt in range(1, _RETRY_MAX_ATTEMPTS + 1):
+        try:
+            return func(*args, **kwargs)
+        except _RETRYABLE_ERRORS:
+            if attempt == _RETRY_MAX_ATTEMPTS:
+                raise
+            time.sleep(random.uniform(0, min(_RETRY_MAX_DELAY, _RETRY_BASE_DELAY * 2 ** attempt)))
+
 def _get_client():
     """
     SecretManagerServiceClientのシングルトンを取得する。
@@ -56,8 +90,9 @@ def get_secret(secret_id: str, logger_instance=None, version_id: str = "latest")
     cache_key = f"{secret_id}:{version_id}"
 
     # まずキャッシュを確認
-    if cache_key in _secret_cache:
-        return _secret_cache[cache_key]
+    cached_value = _secret_cache.get(cache_key)
+    if cached_value is not None:
+        return cached_value
 
     # クライアントを取得（ここで初めてGCP接続が初期化される）
     try:
@@ -68,39 +103,80 @@ def get_secret(secret_id: str, logger_instance=None, version_id: str = "latest")
 
     # シークレットの取得処理
     try:
-        # version_id が "latest" の場合、最新の有効なバージョンを検索
-        if version_id == "latest":
-            
-            secret_path = f"projects/{project_id}/secrets/{secret_id}"
-            # list_secret_versions は例外をスローする可能性がある
-            versions = client.list_secret_versions(request={"parent": secret_path})
-            
-            # 有効なバージョンを探す（デフォルトで新しい順）
-            target_name = None
-            for version in versions:
-                if version.state == secretmanager.SecretVersion.State.ENABLED:
-                    target_name = version.name
-                    log.info(f"Using enabled version: {target_name}")
-                    break
-            
-            if not target_name:
-                raise Exception(f"No enabled versions found for secret: {secret_id}")
-            
-            name = target_name
-        else:
-            name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
-            
-        # シークレットバージョンにアクセス
-        response = client.access_secret_version(request={"name": name})
-        
-        # ペイロードをデコード
-        payload = response.payload.data.decode("UTF-8").strip()
+        payload = _fetch_secret(client, project_id, secret_id, version_id, log)
         
         # 結果をキャッシュに保存
-        _secret_cache[cache_key] = payload
+        _secret_cache.set(cache_key, payload)
         
         return payload
     except Exception as e:
         log.error(f"Error accessing secret: {secret_id}. Details: {e}")
         # エラーが発生した場合は、Noneを返す代わりに例外を再発生させる
-        raise e
\ No newline at end of file
+        raise e
+
+def _fetch_secret(client, project_id: str, secret_id: str, version_id: str, log) -> str:
+    """
+    Secret Managerからシークレットの値を取得し、デコードして返す。
+    version_id が "latest" の場合は、最新の有効なバージョンを検索して使用する。
+    """
+    # version_id が "latest" の場合、最新の有効なバージョンを検索
+    if version_id == "latest":
+        
+        secret_path = f"projects/{project_id}/secrets/{secret_id}"
+        # list_secret_versions は例外をスローする可能性がある
+        versions = _call_with_retry(client.list_secret_versions, request={"parent": secret_path})
+        
+        # 有効なバージョンを探す（デフォルトで新しい順）
+        target_name = None
+        for version in versions:
+            if version.state == secretmanager.SecretVersion.State.ENABLED:
+                target_name = version.name
+                log.info(f"Using enabled version: {target_name}")
+                break
+        
+        if not target_name:
+            raise Exception(f"No enabled versions found for secret: {secret_id}")
+        
+        name = target_name
+    else:
+        name = f"projects/{project_id}/secrets/{secret_id}/versions/{version_id}"
+        
+    # シークレットバージョンにアクセス
+    response = _call_with_retry(client.access_secret_version, request={"name": name})
+    
+    # ペイロードをデコード
+    return response.payload.data.decode("UTF-8").strip()
+
+def prefetch_secrets(secret_ids, logger_instance=None, version_id: str = "latest"):
+    """
+    複数のシークレットをSecret Managerから並列に取得し、キャッシュに格納する。
+    環境変数で設定済み、またはキャッシュ済みのシークレットはスキップする。
+    取得に失敗したシークレットは、後続のget_secret呼び出しで改めて取得される。
+    """
+    log = logger_instance or logger
+
+    targets = [
+        secret_id for secret_id in secret_ids
+        if not os.environ.get(secret_id) and f"{secret_id}:{version_id}" not in _secret_cache
+    ]
+    if not targets:
+        return
+
+    try:
+        client = _get_client()
+    except Exception as e:
+        log.warning(f"Failed to initialize Secret Manager Client for prefetch: {e}")
+        return
+    project_id = _get_project_id()
+
+    with ThreadPoolExecutor(max_workers=min(_PREFETCH_MAX_WORKERS, len(targets))) as executor:
+        futures = {
+            executor.submit(_fetch_secret, client, project_id, secret_id, version_id, log): secret_id
+            for secret_id in targets
+        }
+        for future in as_completed(futures):
+            secret_id = futures[future]
+            try:
+                _secret_cache.set(f"{secret_id}:{version_id}", future.result())
+            except Exception as e:
+                log.warning(f"Failed to prefetch secret: {secret_id}. Details: {e}")
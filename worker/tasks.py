@@ -1,9 +1,18 @@
 import logging
 import datetime
 import os
+import contextvars
+import difflib
+import unicodedata
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
 
 # 独自のモジュールをインポート
 import lineworks_api
+import batching
 import document_ai_processor
 import doc_ai_parser
 import csv_generator
@@ -11,8 +20,160 @@ import gcs_uploader
 import s3_uploader
 import config
 import image_processor
+from context import trace_id_var
+from errors import (
+    StoreLookupError, DownloadError, InvalidFileError, OCRError, TitleNotRecognizedError,
+    KeywordNotMatchedError, CsvGenerationError, UploadError, NotifyError
+)
 from google.cloud import documentai # デバッグ用
 
+# モジュールロガー（ログ出力は%形式の遅延フォーマットで行い、出力されないレベルでは文字列を組み立てない）
+logger = logging.getLogger(__name__)
+
+# アップロードなどI/O待ちの処理を並行実行するためのスレッドプール（タスク間で共有する）
+# 同時に処理するタスク数に合わせた大きさとし、他のタスクのアップロードの後ろで待たされないようにする
+_io_executor = ThreadPoolExecutor(max_workers=config.IO_EXECUTOR_WORKERS, thread_name_prefix="task-io")
+
+def _submit_io(func, *args, **kwargs):
+    """
+    I/O処理をスレッドプールに投入し、Futureを返す。
+    trace_idをログに引き継ぐため、現在のコンテキストのコピー上で実行する。
+    """
+    ctx = contextvars.copy_context()
+    return _io_executor.submit(ctx.run, func, *args, **kwargs)
+
+# CPUとメモリを多く使う画像の前処理は、同時に実行する数を制限する
+# (I/O待ちのタスクは多数並行させつつ、1 vCPU / 1GiB のインスタンスで画像処理が競合しないようにする)
+_image_process_slots = threading.BoundedSemaphore(config.IMAGE_PROCESS_CONCURRENCY)
+
+# 画像の前処理用のプロセスプール（IMAGE_PROCESS_WORKERS > 0 の場合のみ使用、遅延初期化用）
+_image_process_pool = None
+_image_process_pool_lock = threading.Lock()
+
+def _get_image_process_pool():
+    """
+    画像の前処理用のProcessPoolExecutorのシングルトンを取得する。
+    初回呼び出し時のみ初期化を行う（遅延ロード）。
+    スレッドを持つプロセスからのforkは安全でないため、子プロセスはspawnで起動する。
+    """
+    global _image_process_pool
+    if _image_process_pool is None:
+        with _image_process_pool_lock:
+            if _image_process_pool is None:
+                _image_process_pool = ProcessPoolExecutor(
+                    max_workers=config.IMAGE_PROCESS_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=image_processor.init_worker_process
+                )
+    return _image_process_pool
+
+def _process_image(file_bytes):
+    """
+    画像の前処理を実行する。
+    IMAGE_PROCESS_WORKERS が設定されている場合は子プロセスで実行し、GILに縛られず並列に処理する。
+    子プロセスが異常終了した場合はプールを作り直し、この回はリクエストのスレッドで実行する。
+    """
+    global _image_process_pool
+    if config.IMAGE_PROCESS_WORKERS <= 0:
+        return image_processor.process_image(file_bytes)
+
+    pool = _get_image_process_pool()
+    # 画像は共有メモリ経由で子プロセスに渡し、プロセス間でのバイト列のコピー（pickle）を省く
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(file_bytes)))
+    try:
+        shm.buf[:len(file_bytes)] = file_bytes
+        processed = pool.submit(
+            image_processor.process_shared_image, shm.name, len(file_bytes), trace_id_var.get()
+        ).result()
+        # None の場合は元画像をそのまま使用する
+        return file_bytes if processed is None else processed
+    except BrokenProcessPool:
+        logger.warning("画像処理の子プロセスが異常終了しました。プールを作り直し、この画像はスレッド上で処理します。", exc_info=True)
+        with _image_process_pool_lock:
+            if _image_process_pool is pool:
+                _image_process_pool = None
+        pool.shutdown(wait=False)
+        return image_processor.process_image(file_bytes)
+    finally:
+        shm.close()
+        shm.unlink()
+
+# ファイルサイズが上限（config.MAX_IMAGE_BYTES）を超えた場合にユーザーへ通知するメッセージ
+_FILE_TOO_LARGE_MESSAGE = "写真のファイルサイズが大きすぎます。サイズを小さくして、もう一度アップロードしてください。"
+
+# OCRで読み取ったタイトルが表記揺れでキーワードと完全一致しない場合に、近いキーワードとみなす類似度の下限
+_KEYWORD_MATCH_CUTOFF = 0.8
+# 最も近いキーワードが、次点のキーワードをこの差以上で上回る場合のみ採用する（同点・僅差は判定しない）
+_KEYWORD_MATCH_MARGIN = 0.1
+# 同時に含まれる場合は帳票の種類を決められない特徴文字の組（doc_ai_parser._normalize_title の排他制御と同じ）
+_EXCLUSIVE_TITLE_CHARS = (
+    (config.PAYMENT_CHARS, config.RECEIPT_CHARS),
+    (config.CREDIT_CHARS, config.CASH_CHARS),
+)
+
+def _match_keyword(title):
+    """
+    読み取ったタイトルに対応するキーワードを返す。該当しない場合は None を返す。
+    NFKC正規化後に完全一致を確認し、一致しない場合のみ類似度による照合を行う。
+    支払と受入のように排他的な特徴文字を両方含むタイトルや、
+    近いキーワードが一意に決まらないタイトルは、誤った種類で計上しないよう照合しない。
+    """
+    if not title:
+        return None
+    normalized = unicodedata.normalize('NFKC', title)
+    if normalized in config.KEYWORDS:
+        return normalized
+
+    chars = set(normalized)
+    if any(chars & first and chars & second for first, second in _EXCLUSIVE_TITLE_CHARS):
+        logger.info("タイトルに排他的な特徴文字が含まれるため、類似度による照合を行いません: '%s'", title)
+        return None
+
+    matcher = difflib.SequenceMatcher(b=normalized)
+    scores = []
+    for keyword in config.KEYWORDS:
+        matcher.set_seq1(keyword)
+        scores.append((matcher.ratio(), keyword))
+    scores.sort(reverse=True)
+
+    best_score, best_keyword = scores[0]
+    runner_up_score = scores[1][0] if len(scores) > 1 else 0.0
+    if best_score < _KEYWORD_MATCH_CUTOFF or best_score - runner_up_score < _KEYWORD_MATCH_MARGIN:
+        return None
+    logger.info("タイトルを近いキーワードとみなしました: '%s' -> '%s'", title, best_keyword)
+    return best_keyword
+
+# エラー通知の送信完了を待つ上限時間（秒）
+_ERROR_NOTIFY_TIMEOUT = 10
+
+def _safe_notify(recipient_id, payload):
+    """
+    ユーザーへの通知を送信する。エラーログの記録と並行して送信するため、スレッドプール上で実行される。
+    送信自体に失敗した場合は、重大なエラーとしてログに記録する。
+    """
+    try:
+        err_send = lineworks_api.send_lw_message(recipient_id, payload)
+    except Exception as e:
+        err_send = e
+    if err_send:
+        logger.critical("重大なエラー: ユーザーへのエラー通知の送信にも失敗しました: %s", err_send)
+
+def _get_staged_image_path(staging_future):
+    """
+    原本画像の一時領域へのアップロード結果を待ち、オブジェクト名を返す。
+    失敗した場合は None を返す（各保存処理は原本のバイト列を直接アップロードする）。
+    """
+    if staging_future is None:
+        return None
+    try:
+        staged_image_path, err = staging_future.result()
+    except Exception:
+        logger.warning("原本画像の一時領域へのアップロード中に予期せぬエラーが発生しました。", exc_info=True)
+        return None
+    if err:
+        logger.warning("原本画像の一時領域へのアップロードに失敗しました: %s", err)
+        return None
+    return staged_image_path
 
 def process_image_and_reply(file_id, user_id, channel_id, trace_id: str):
     """
@@ -20,92 +181,142 @@ def process_image_and_reply(file_id, user_id, channel_id, trace_id: str):
     構造化ロギングを使用する。
     """
 
+    # 以降のログと外部呼び出し（traceparentヘッダー）に trace_id を引き継ぐ
+    # (I/Oスレッドにはコンテキストのコピーとして伝播する)
+    trace_id_var.set(trace_id)
+
     recipient_id = user_id if user_id else channel_id
     if not recipient_id:
         # このエラーはmain.pyに捕捉される
         raise ValueError("受信者IDが不明。")
 
-    user_facing_error = ""
+    staging_future = None
     try:
         # --- 1. 店舗コードを取得 ---
-        logging.info("ステップ1: 店舗コードの取得を開始...")
-        store_code, err = lineworks_api.get_store_code_by_user(user_id)
+        logger.info("ステップ1: 店舗コードの取得を開始...")
+        # 同時期に届いた同一ユーザーのタスクとまとめて取得する
+        store_code, err = batching.get_store_code(user_id).result()
         if err:
-            user_facing_error = f"店舗コードを取得できませんでした。ITHDへお問い合わせください。"
-            raise Exception(f"店舗コードの取得に失敗しました: {err}")
-        logging.info(f"店舗コード取得成功: {store_code}")
+            raise StoreLookupError(
+                f"店舗コードの取得に失敗しました: {err}",
+                "店舗コードを取得できませんでした。ITHDへお問い合わせください。"
+            )
+        logger.info("店舗コード取得成功: %s", store_code)
 
         # --- 2. ファイルをダウンロード ---
-        logging.info(f"ステップ2: ファイルのダウンロードを開始: fileId={file_id}")
-        file_bytes, err = lineworks_api.download_lw_attachment(file_id)
+        logger.info("ステップ2: ファイルのダウンロードを開始: fileId=%s", file_id)
+        try:
+            file_bytes, err = lineworks_api.download_lw_attachment(file_id)
+        except lineworks_api.AttachmentTooLargeError as e:
+            raise InvalidFileError(f"File too large: {e}", _FILE_TOO_LARGE_MESSAGE) from e
         if err:
-            user_facing_error = f"写真の処理に失敗しました。お手数ですが、テレマスにて手入力してください。"
-            raise Exception(f"Download failed: {err}")
+            raise DownloadError(
+                f"Download failed: {err}",
+                "写真の処理に失敗しました。お手数ですが、テレマスにて手入力してください。"
+            )
+
+        # 画像処理やDocument AIの前に、サイズと形式（先頭バイト）を確認して不正なファイルを早期に除外する
+        if len(file_bytes) > config.MAX_IMAGE_BYTES:
+            raise InvalidFileError(f"File too large: {len(file_bytes)} bytes", _FILE_TOO_LARGE_MESSAGE)
+        if image_processor.sniff_image_mime_type(file_bytes) is None:
+            raise InvalidFileError(
+                f"Unsupported file type: header={file_bytes[:8].hex()}",
+                "対応していないファイル形式です。出納票の写真（JPEGまたはPNG）をアップロードしてください。"
+            )
+
+        # 原本画像は後続の画像処理・Document AIと並行して一時領域へアップロードしておく
+        # (保存先の確定後はサーバー側コピーで保存するため、待ち時間がOCRの処理時間に隠れる)
+        staging_future = _submit_io(gcs_uploader.upload_staging_image, file_bytes)
 
         # --- 2.5 画像の前処理 (回転補正 & 影除去) ---
-        logging.info("ステップ2.5: 画像の前処理(回転補正・影除去)を開始...")
-        processed_file_bytes = image_processor.process_image(file_bytes)
+        logger.info("ステップ2.5: 画像の前処理(回転補正・影除去)を開始...")
+        with _image_process_slots:
+            processed_file_bytes = _process_image(file_bytes)
 
         # --- 3. Document AIでファイルを処理 ---
         # 処理済みの画像を使用することでOCR精度を向上させる
-        logging.info("ステップ3: Document AIでの処理を開始...")
-        document, err = document_ai_processor.process_document(processed_file_bytes, 'image/jpeg')
+        logger.info("ステップ3: Document AIでの処理を開始...")
+        # 前処理の結果は通常JPEGだが、元画像をそのまま使う場合もあるため、実際の形式を渡す
+        processed_mime_type = image_processor.sniff_image_mime_type(processed_file_bytes) or 'image/jpeg'
+        document, err = document_ai_processor.process_document(processed_file_bytes, processed_mime_type)
         if err:
-            user_facing_error = "写真の読み取り処理（OCR）中にエラーが発生しました。お手数ですが、テレマスにて手入力してください。"
-            raise Exception(f"Document AI failed: {err}")
+            raise OCRError(
+                f"Document AI failed: {err}",
+                "写真の読み取り処理（OCR）中にエラーが発生しました。お手数ですが、テレマスにて手入力してください。"
+            )
 
         # --- 4. AIの解析結果を構造化データに変換 ---
-        logging.info("ステップ4: AI解析結果の構造化を開始...")
+        logger.info("ステップ4: AI解析結果の構造化を開始...")
         parsed_data, is_review_needed, user_warning = doc_ai_parser.parse_document_entities(document)
         if not parsed_data or not parsed_data.get('title'):
             # タイトルが読み取れなかった場合、画像をレビュー用フォルダに保存する
             # 原本画像と処理済み画像の両方を保存する
-            gcs_uploader.upload_error_image(store_code, file_bytes, processed_image_bytes=processed_file_bytes)
-            user_facing_error = "写真の処理に失敗しました。出納票の写真を正しく撮影して、もう一度アップロードするか、テレマスにて手入力してください。"
-            raise Exception("No valid data parsed from document.")
+            gcs_uploader.upload_error_image(
+                store_code,
+                file_bytes,
+                processed_image_bytes=processed_file_bytes,
+                staged_image_path=_get_staged_image_path(staging_future)
+            )
+            raise TitleNotRecognizedError(
+                "No valid data parsed from document.",
+                "写真の処理に失敗しました。出納票の写真を正しく撮影して、もう一度アップロードするか、テレマスにて手入力してください。"
+            )
 
         # --- 4.5. タイトルがキーワードに存在するかチェック ---
-        title = parsed_data.get('title', '')
-        if title not in config.KEYWORDS:
-            user_facing_error = "写真の処理に失敗しました。出納票の写真を正しく撮影して、もう一度アップロードするか、テレマスにて手入力してください。"
-            raise Exception(f"Title '{title}' not in recognized keywords.")
-
-        # --- 5. CSVファイル内容(BOMなし)を生成 ---
-        logging.info("ステップ5: CSVファイル内容の生成を開始...")
-        csv_content, err = csv_generator.generate_csv_content(parsed_data)
+        raw_title = parsed_data.get('title', '')
+        title = _match_keyword(raw_title)
+        if title is None:
+            raise KeywordNotMatchedError(
+                f"Title '{raw_title}' not in recognized keywords.",
+                "写真の処理に失敗しました。出納票の写真を正しく撮影して、もう一度アップロードするか、テレマスにて手入力してください。"
+            )
+        # CSVの内容・ファイル名にも照合後のキーワードを用いる
+        parsed_data['title'] = title
+
+        # --- 5. CSVファイル内容(BOMなし, UTF-8バイト列)を生成 ---
+        logger.info("ステップ5: CSVファイル内容の生成を開始...")
+        csv_content_bytes, err = csv_generator.generate_csv_content(parsed_data)
         if err:
-            user_facing_error = "ファイルの作成に失敗しました。お手数ですが、テレマスにて手入力してください。"
-            raise Exception(f"CSV generation failed: {err}")
-        csv_content_bytes = csv_content.encode('utf-8')
+            raise CsvGenerationError(
+                f"CSV generation failed: {err}",
+                "ファイルの作成に失敗しました。お手数ですが、テレマスにて手入力してください。"
+            )
 
         # --- 6. GCS/S3用のファイル名を生成 ---
         gcs_filename = csv_generator.generate_csv_filename(store_code, parsed_data.get('title'))
-        logging.info(f"生成されたファイル名: {gcs_filename}")   
+        logger.info("生成されたファイル名: %s", gcs_filename)
+
+        # --- 7. GCSへ成果物をアップロード / 8. S3（検証環境）へアップロード ---
+        # 互いに独立したネットワークI/Oのため並行して実行し、両方の完了を待ってから成功を通知する
+        logger.info("ステップ7: GCSへの成果物アップロードを開始...")
+        gcs_future = _submit_io(
+            gcs_uploader.upload_processed_results,
+            is_review_needed=is_review_needed,
+            store_code=store_code,
+            csv_filename=gcs_filename,
+            image_bytes=file_bytes,
+            csv_bytes=csv_content_bytes,
+            processed_image_bytes=processed_file_bytes,
+            staged_image_path=_get_staged_image_path(staging_future)
+        )
+        logger.info("ステップ8: S3へのアップロードを開始...")
+        s3_future = _submit_io(s3_uploader.upload_to_s3, csv_content_bytes, gcs_filename)
 
-        # --- 7. GCSへ成果物をアップロード ---
-        logging.info("ステップ7: GCSへの成果物アップロードを開始...")
         try:
-            gcs_uploader.upload_processed_results(
-                is_review_needed=is_review_needed,
-                store_code=store_code,
-                csv_filename=gcs_filename,
-                image_bytes=file_bytes,
-                csv_bytes=csv_content_bytes,
-                processed_image_bytes=processed_file_bytes
-            )
+            gcs_future.result()
         except Exception:
             # この処理はノンクリティカルなので、失敗しても警告ログのみで処理を続行
-            logging.warning("GCSへの成果物アップロード中に予期せぬエラーが発生しました。", exc_info=True)
+            logger.warning("GCSへの成果物アップロード中に予期せぬエラーが発生しました。", exc_info=True)
 
-        # --- 8. S3（検証環境）へアップロード ---
-        logging.info("ステップ8: S3へのアップロードを開始...")
-        _, err = s3_uploader.upload_to_s3(csv_content_bytes, gcs_filename)
+        _, err = s3_future.result()
         if err:
-            user_facing_error = "処理結果を保存する際にエラーが発生しました。お手数ですが、テレマスにて手入力してください。"
-            raise Exception(f"S3 Upload failed: {err}")
+            raise UploadError(
+                f"S3 Upload failed: {err}",
+                "処理結果を保存する際にエラーが発生しました。お手数ですが、テレマスにて手入力してください。"
+            )
 
         # --- 9. ユーザーに成功を通知 ---
-        logging.info("ステップ9: ユーザーへの成功通知を送信...")
+        logger.info("ステップ9: ユーザーへの成功通知を送信...")
         success_message = f"「{title}」の処理とアップロードが正常に完了しました。"
         
         if user_warning:
@@ -114,22 +325,27 @@ def process_image_and_reply(file_id, user_id, channel_id, trace_id: str):
         success_payload = {"content": {"type": "text", "text": success_message}}
         err = lineworks_api.send_lw_message(recipient_id, success_payload)
         if err:
-            raise Exception(f"成功メッセージの送信に失敗しました: {err}")
+            raise NotifyError(f"成功メッセージの送信に失敗しました: {err}")
 
     except Exception as e:
         # --- 統一エラー処理 ---
         # ユーザーに送信するエラーメッセージを確定
+        user_facing_error = getattr(e, "user_facing_message", None)
         if not user_facing_error:
             user_facing_error = "処理中に予期せぬ問題が発生しました。お手数ですが、テレマスにて手入力してください。"
         
         # ユーザーへのエラー通知を試みる
+        # 送信はエラーログの記録と並行して行い、レスポンスを返す前に上限時間まで完了を待つ
+        # (レスポンス後はCloud RunがCPUを絞るため、待たずに返すと通知が遅延・欠落する)
+        # (送信自体に失敗した場合のログ記録は _safe_notify が行う)
         error_payload = {"content": {"type": "text", "text": user_facing_error}}
-        err_send = lineworks_api.send_lw_message(recipient_id, error_payload)
-        if err_send:
-            # エラー通知の送信自体に失敗した場合は、重大なエラーとしてログに記録
-            logging.critical(f"重大なエラー: ユーザーへのエラー通知の送信にも失敗しました: {err_send}")
+        notify_future = _submit_io(_safe_notify, recipient_id, error_payload)
 
-        logging.error(f"タスク処理中にエラーが発生しました: {e}", exc_info=True)
+        logger.error("タスク処理中にエラーが発生しました: %s", e, exc_info=True)
+        try:
+            notify_future.result(timeout=_ERROR_NOTIFY_TIMEOUT)
+        except FutureTimeoutError:
+            logger.warning("エラー通知の送信が%s秒以内に完了しませんでした。", _ERROR_NOTIFY_TIMEOUT)
         # main.pyに例外を再発生させて、タスクが失敗したことを伝える
         # main.py側で完全なスタックトレースが記録される
         raise e
\ No newline at end of file
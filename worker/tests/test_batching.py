@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+import batching
+import lineworks_api
+from context import trace_id_var
+
+# Futureの結果を待つ上限時間（秒）
+_RESULT_TIMEOUT = 5
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def _submit_all(self, batcher, keys):
+        """バッチの待ち時間内にまとめて投入し、各Futureの結果（失敗した場合は例外）を返す。"""
+        futures = [batcher.submit(key) for key in keys]
+        results = [future.exception(_RESULT_TIMEOUT) or future.result() for future in futures]
+        return futures, results
+
+    def test_same_key_is_resolved_once(self):
+        """同じキーの投入は1回の処理にまとめられ、全てのFutureに同じ結果が配布されること"""
+        func = MagicMock(side_effect=lambda key: f"value-{key}")
+        batcher = batching.MicroBatcher(func, max_wait_ms=200, name="test-batcher")
+
+        _, results = self._submit_all(batcher, ["u1", "u1", "u2", "u1"])
+
+        self.assertEqual(results, ["value-u1", "value-u1", "value-u2", "value-u1"])
+        self.assertEqual(sorted(call.args[0] for call in func.call_args_list), ["u1", "u2"])
+
+    def test_failure_is_isolated_per_key(self):
+        """あるキーの処理が失敗しても、そのキーのFutureだけが例外になること"""
+        def func(key):
+            if key == "bad":
+                raise RuntimeError("lookup failed")
+            return f"value-{key}"
+        batcher = batching.MicroBatcher(func, max_wait_ms=200, name="test-batcher")
+
+        futures, results = self._submit_all(batcher, ["bad", "good", "bad"])
+
+        self.assertIsInstance(results[0], RuntimeError)
+        self.assertIs(results[0], results[2])
+        self.assertEqual(futures[1].result(), "value-good")
+
+    def test_func_runs_in_caller_context(self):
+        """処理は投入元のコンテキスト（trace_id）で実行されること"""
+        seen = []
+        batcher = batching.MicroBatcher(
+            lambda key: seen.append(trace_id_var.get()), max_wait_ms=10, name="test-batcher"
+        )
+        token = trace_id_var.set("trace-for-batch")
+        try:
+            batcher.submit("u1").result(_RESULT_TIMEOUT)
+        finally:
+            trace_id_var.reset(token)
+        self.assertEqual(seen, ["trace-for-batch"])
+
+    def test_get_store_code_returns_cached_value_without_batching(self):
+        """キャッシュ済みの店舗コードは、バッチを経由せず完了済みのFutureで返すこと"""
+        with patch.object(lineworks_api, 'get_cached_store_code', return_value="STORE001"), \
+             patch.object(batching, '_get_store_code_batcher') as mock_get_batcher:
+            future = batching.get_store_code("u1")
+
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), ("STORE001", None))
+        mock_get_batcher.assert_not_called()
+
+    def test_get_store_code_batches_on_cache_miss(self):
+        """キャッシュに無い場合は店舗コード取得APIの結果（タプル）をそのまま返すこと"""
+        with patch.object(lineworks_api, 'get_cached_store_code', return_value=None), \
+             patch.object(lineworks_api, 'get_store_code_by_user', return_value=(None, "not found")) as mock_lookup:
+            result = batching.get_store_code("u-miss").result(_RESULT_TIMEOUT)
+
+        self.assertEqual(result, (None, "not found"))
+        mock_lookup.assert_called_once_with("u-miss")
+
+if __name__ == '__main__':
+    unittest.main()
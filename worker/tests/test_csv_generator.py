@@ -0,0 +1,62 @@
+import unittest
+import csv
+import io
+import re
+
+import csv_generator
+
+def _reference_csv(rows):
+    """csv.writer のみで組み立てた、比較用のCSVバイト列を返す。"""
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\r\n')
+    writer.writerow(('項目', '金額'))
+    writer.writerows(rows)
+    return output.getvalue().encode('utf-8')
+
+class TestGenerateCsvContent(unittest.TestCase):
+
+    def test_fast_path_matches_csv_writer(self):
+        """クォート不要な値のみの場合、csv.writer と同じバイト列を生成すること"""
+        parsed_data = {'line_items': [
+            {'item': '交通費', 'amount': '1000'},
+            {'item': '消耗品 費', 'amount': 250},
+        ]}
+        content, err = csv_generator.generate_csv_content(parsed_data)
+        self.assertIsNone(err)
+        self.assertEqual(content, _reference_csv([('交通費', '1000'), ('消耗品 費', '250')]))
+
+    def test_quoted_values_match_csv_writer(self):
+        """カンマ・引用符・改行を含む値は、csv.writer と同じくクォートすること"""
+        rows = [('A,B', '1,000'), ('say "hi"', '2'), ('line\nbreak', '3')]
+        parsed_data = {'line_items': [{'item': item, 'amount': amount} for item, amount in rows]}
+        content, err = csv_generator.generate_csv_content(parsed_data)
+        self.assertIsNone(err)
+        self.assertEqual(content, _reference_csv(rows))
+
+    def test_missing_values_become_empty_fields(self):
+        """None や欠けた値は空のフィールドとして出力すること"""
+        parsed_data = {'line_items': [{'item': None, 'amount': '100'}, {'item': '雑費'}]}
+        content, _ = csv_generator.generate_csv_content(parsed_data)
+        self.assertEqual(content, _reference_csv([('', '100'), ('雑費', '')]))
+
+    def test_empty_data_outputs_header_only(self):
+        """明細が無い場合はヘッダー行のみを出力すること"""
+        for parsed_data in (None, {}, {'line_items': []}):
+            content, err = csv_generator.generate_csv_content(parsed_data)
+            self.assertIsNone(err)
+            self.assertEqual(content, '項目,金額\r\n'.encode('utf-8'))
+
+class TestGenerateCsvFilename(unittest.TestCase):
+
+    def test_filename_format_and_sanitizing(self):
+        """タイムスタンプ_店舗コード_種類.csv の形式で、'/' と空白を '_' に置換すること"""
+        filename = csv_generator.generate_csv_filename('STORE001', '現金/支払 A　B')
+        self.assertRegex(filename, r'^\d{14}_STORE001_現金_支払_A_B\.csv$')
+
+    def test_missing_title(self):
+        """種類が無い場合は NoTitle とすること"""
+        filename = csv_generator.generate_csv_filename('STORE001', None)
+        self.assertTrue(re.fullmatch(r'\d{14}_STORE001_NoTitle\.csv', filename))
+
+if __name__ == '__main__':
+    unittest.main()
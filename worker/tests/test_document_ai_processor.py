@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from google.cloud import documentai
+
+import document_ai_processor
+
+class TestDocumentAiProcessor(unittest.TestCase):
+
+    def setUp(self):
+        document_ai_processor._document_cache.clear()
+        self.mock_client = MagicMock()
+        self.mock_client.processor_path.return_value = "projects/p/locations/l/processors/x"
+        self.mock_client.processor_version_path.return_value = "projects/p/locations/l/processors/x/processorVersions/v"
+        patcher = patch.object(document_ai_processor, '_get_client', return_value=self.mock_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _set_response(self):
+        document = documentai.Document(
+            text="現金支払",
+            content=b"original" * 100,
+            pages=[documentai.Document.Page(image=documentai.Document.Page.Image(content=b"png" * 100))],
+        )
+        self.mock_client.process_document.return_value = documentai.ProcessResponse(document=document)
+
+    def test_same_content_is_processed_once(self):
+        """同じ内容・MIMEタイプのファイルはDocument AIを1回だけ呼び出し、2回目はキャッシュから返すこと"""
+        self._set_response()
+        first, err = document_ai_processor.process_document(b"image", "image/jpeg")
+        self.assertIsNone(err)
+        second, err = document_ai_processor.process_document(b"image", "image/jpeg")
+        self.assertIsNone(err)
+
+        self.assertEqual(self.mock_client.process_document.call_count, 1)
+        self.assertEqual(second.text, "現金支払")
+
+    def test_different_content_or_mime_type_is_not_shared(self):
+        """内容またはMIMEタイプが異なる場合はキャッシュを共有しないこと"""
+        self._set_response()
+        document_ai_processor.process_document(b"image", "image/jpeg")
+        document_ai_processor.process_document(b"image2", "image/jpeg")
+        document_ai_processor.process_document(b"image", "image/png")
+        self.assertEqual(self.mock_client.process_document.call_count, 3)
+
+    def test_cached_document_has_no_binary_payloads(self):
+        """キャッシュする処理結果から、元ファイルの内容とページ画像が削除されていること"""
+        self._set_response()
+        document, _ = document_ai_processor.process_document(b"image", "image/jpeg")
+        self.assertEqual(document.content, b"")
+        self.assertNotIn('image', document.pages[0])
+        self.assertEqual(document.text, "現金支払")
+
+    def test_failure_is_not_cached(self):
+        """処理に失敗した場合はエラーを返し、結果をキャッシュしないこと"""
+        self.mock_client.process_document.side_effect = RuntimeError("unavailable")
+        document, err = document_ai_processor.process_document(b"image", "image/jpeg")
+        self.assertIsNone(document)
+        self.assertIn("unavailable", err)
+
+        self._set_response()
+        self.mock_client.process_document.side_effect = None
+        document, err = document_ai_processor.process_document(b"image", "image/jpeg")
+        self.assertIsNone(err)
+        self.assertEqual(self.mock_client.process_document.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import re
+
+import requests
+
+import http_client
+from context import trace_id_var
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-01$')
+
+class TestBuildTraceparent(unittest.TestCase):
+
+    def test_hex_and_uuid_trace_ids(self):
+        """16進数32桁とUUID形式（ハイフン付き・大文字）の trace_id から同じ trace-id を生成すること"""
+        trace_id = "0123456789abcdef0123456789abcdef"
+        for value in (trace_id, "01234567-89ab-cdef-0123-456789abcdef", "01234567-89AB-CDEF-0123-456789ABCDEF"):
+            match = _TRACEPARENT_RE.match(http_client.build_traceparent(value))
+            self.assertIsNotNone(match, value)
+            self.assertEqual(match.group(1), trace_id)
+
+    def test_span_id_is_random_per_call(self):
+        """span-id はリクエストごとに生成すること"""
+        trace_id = "0123456789abcdef0123456789abcdef"
+        first = _TRACEPARENT_RE.match(http_client.build_traceparent(trace_id)).group(2)
+        second = _TRACEPARENT_RE.match(http_client.build_traceparent(trace_id)).group(2)
+        self.assertNotEqual(first, second)
+
+    def test_invalid_trace_ids(self):
+        """形式が不正な trace_id・全て0の trace_id・未設定の場合は None を返すこと"""
+        for value in (None, "", "N/A", "trace_id_789", "0" * 32, "g" * 32, "0123456789abcdef"):
+            self.assertIsNone(http_client.build_traceparent(value), value)
+
+class TestTracingSession(unittest.TestCase):
+
+    def _prepare(self, headers=None):
+        request = requests.Request('GET', 'https://example.com/', headers=headers or {})
+        return http_client.SESSION.prepare_request(request)
+
+    def test_adds_traceparent_from_context(self):
+        """現在のコンテキストの trace_id から traceparent ヘッダーを付与すること"""
+        token = trace_id_var.set("01234567-89ab-cdef-0123-456789abcdef")
+        try:
+            prepared = self._prepare()
+        finally:
+            trace_id_var.reset(token)
+        match = _TRACEPARENT_RE.match(prepared.headers['traceparent'])
+        self.assertEqual(match.group(1), "0123456789abcdef0123456789abcdef")
+
+    def test_keeps_explicit_header_and_skips_invalid_trace_id(self):
+        """呼び出し側が指定したヘッダーは上書きせず、trace_id が不正な場合は付与しないこと"""
+        token = trace_id_var.set("0123456789abcdef0123456789abcdef")
+        try:
+            prepared = self._prepare({'traceparent': 'explicit'})
+        finally:
+            trace_id_var.reset(token)
+        self.assertEqual(prepared.headers['traceparent'], 'explicit')
+
+        token = trace_id_var.set("N/A")
+        try:
+            prepared = self._prepare()
+        finally:
+            trace_id_var.reset(token)
+        self.assertNotIn('traceparent', prepared.headers)
+
+if __name__ == '__main__':
+    unittest.main()
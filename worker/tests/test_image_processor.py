@@ -0,0 +1,135 @@
+import unittest
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+import image_processor
+
+def _tiff_with_orientation(orientation: int, byteorder: str = 'little') -> bytes:
+    """Orientationタグのみを持つ、EXIF(TIFF形式)のバイト列を生成する。"""
+    prefix = b'II' if byteorder == 'little' else b'MM'
+    header = prefix + (42).to_bytes(2, byteorder) + (8).to_bytes(4, byteorder)
+    entry = (
+        (0x0112).to_bytes(2, byteorder) + (3).to_bytes(2, byteorder) + (1).to_bytes(4, byteorder)
+        + orientation.to_bytes(2, byteorder) + b'\x00\x00'
+    )
+    return header + (1).to_bytes(2, byteorder) + entry + (0).to_bytes(4, byteorder)
+
+def _jpeg_bytes(shape=(8, 8), tiff=None) -> bytes:
+    """
+    テスト用のJPEGを cv2.imencode で生成する。
+    tiff を指定した場合は、EXIFのAPP1セグメントとしてSOIの直後に埋め込む。
+    """
+    gray = np.zeros(shape, dtype=np.uint8)
+    # 上半分を明るくし、回転の有無をデコード結果から判別できるようにする
+    gray[:shape[0] // 2] = 255
+    success, buffer = cv2.imencode('.jpg', gray)
+    assert success
+    jpeg = buffer.tobytes()
+    if tiff is None:
+        return jpeg
+    payload = b'Exif\x00\x00' + tiff
+    app1 = b'\xff\xe1' + (len(payload) + 2).to_bytes(2, 'big') + payload
+    return jpeg[:2] + app1 + jpeg[2:]
+
+class TestImageProcessor(unittest.TestCase):
+
+    def test_portrait_paper_skips_orientation_analysis(self):
+        """縦長の用紙を検出した場合は、テキスト特徴の分析を省略して回転しないこと"""
+        analyzer = image_processor.DocAnalyzer
+        gray = np.full((1000, 800), 128, dtype=np.uint8)
+        mask = np.zeros_like(gray)
+        with patch.object(analyzer, '_extract_text_orientation_features') as mock_extract:
+            self.assertIsNone(analyzer.analyze_orientation_90(gray, mask, (100, 50, 500, 900)))
+        mock_extract.assert_not_called()
+
+    def test_full_frame_mask_does_not_skip_orientation_analysis(self):
+        """全画面マスクの場合は、撮影画像が縦長でも分析を行い、その判定に従うこと"""
+        analyzer = image_processor.DocAnalyzer
+        gray = np.full((1000, 800), 128, dtype=np.uint8)
+        mask = np.full_like(gray, 255)
+        with patch.object(analyzer, '_extract_text_orientation_features', return_value=([], [])) as mock_extract, \
+             patch.object(analyzer, '_decide_90_rotation', return_value=0) as mock_decide:
+            self.assertEqual(analyzer.analyze_orientation_90(gray, mask), 0)
+        mock_extract.assert_called_once()
+        mock_decide.assert_called_once_with([], [])
+
+    def test_imdecode_applies_exif_orientation(self):
+        """process_image と同じ cv2.imdecode（グレースケール）のデコードで、EXIFの回転情報が適用されること"""
+        for orientation, expected_shape in ((1, (40, 80)), (3, (40, 80)), (6, (80, 40)), (8, (80, 40))):
+            jpeg = _jpeg_bytes((40, 80), _tiff_with_orientation(orientation))
+            gray = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_GRAYSCALE)
+            self.assertEqual(gray.shape, expected_shape, orientation)
+        # 180度回転では、明るい上半分が下側に移ること
+        jpeg = _jpeg_bytes((40, 80), _tiff_with_orientation(3))
+        gray = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_GRAYSCALE)
+        self.assertLess(gray[:20].mean(), gray[20:].mean())
+
+    def test_undecodable_input_returns_original_bytes(self):
+        """デコードできないデータは、例外を送出せず元のバイト列をそのまま返すこと"""
+        for data in (b'', b'not an image', b'\xff\xd8\xff' + b'\x00' * 16):
+            self.assertEqual(image_processor.process_image(data), data)
+
+    def test_exif_orientation_all_values(self):
+        """EXIFのOrientationを、画像をデコードせずに読み取れること"""
+        for orientation in range(1, 9):
+            jpeg = _jpeg_bytes(tiff=_tiff_with_orientation(orientation))
+            self.assertEqual(image_processor._read_jpeg_exif_orientation(jpeg), orientation)
+
+    def test_exif_orientation_after_other_segments(self):
+        """JFIF(APP0)などの他のセグメントの後ろにあるEXIFも読み取れること"""
+        jpeg = _jpeg_bytes()
+        app0_end = 4 + int.from_bytes(jpeg[4:6], 'big')
+        exif = _jpeg_bytes(tiff=_tiff_with_orientation(8))
+        app1_end = 4 + int.from_bytes(exif[4:6], 'big')
+        combined = jpeg[:app0_end] + exif[2:app1_end] + jpeg[app0_end:]
+        self.assertEqual(image_processor._read_jpeg_exif_orientation(combined), 8)
+
+    def test_exif_orientation_big_endian(self):
+        """ビッグエンディアン(MM)のEXIFも読み取れること"""
+        jpeg = _jpeg_bytes(tiff=_tiff_with_orientation(6, 'big'))
+        self.assertEqual(image_processor._read_jpeg_exif_orientation(jpeg), 6)
+
+    def test_exif_orientation_defaults(self):
+        """EXIFが無いJPEGは1、JPEGでないデータは None を返すこと"""
+        self.assertEqual(image_processor._read_jpeg_exif_orientation(_jpeg_bytes()), 1)
+        self.assertIsNone(image_processor._read_jpeg_exif_orientation(b'\x89PNG\r\n\x1a\n'))
+        self.assertIsNone(image_processor._read_jpeg_exif_orientation(b''))
+
+    def test_exif_orientation_malformed(self):
+        """壊れた・途中で切れたEXIFでも例外を送出せず、1（回転なし）を返すこと"""
+        parse = image_processor._parse_tiff_orientation
+        tiff = _tiff_with_orientation(3)
+        self.assertEqual(parse(memoryview(tiff)), 3)
+        # 不正なバイトオーダー・IFDオフセットが範囲外・エントリが途中で切れている
+        self.assertEqual(parse(memoryview(b'XX' + tiff[2:])), 1)
+        self.assertEqual(parse(memoryview(tiff[:8] + b'\x00')), 1)
+        self.assertEqual(parse(memoryview(tiff[:14])), 1)
+        self.assertEqual(parse(memoryview(b'')), 1)
+
+        # セグメント長が本文を超えるJPEGも読み取りを打ち切ること
+        truncated = b'\xff\xd8\xff\xe1\xff\xff' + b'Exif\x00\x00' + tiff[:6]
+        self.assertEqual(image_processor._read_jpeg_exif_orientation(truncated), 1)
+
+    def test_ink_density_matches_cv2_otsu(self):
+        """ヒストグラムから求めたインク画素数が、cv2.threshold(Otsu, BINARY_INV) の非ゼロ画素数と一致すること"""
+        rng = np.random.default_rng(0)
+        rois = [
+            rng.integers(0, 256, (60, 80), dtype=np.uint8),
+            np.where(rng.random((50, 70)) < 0.2, 30, 220).astype(np.uint8),
+            np.clip(rng.normal(200, 10, (40, 40)), 0, 255).astype(np.uint8),
+            np.full((10, 10), 255, dtype=np.uint8),
+            np.full((10, 10), 0, dtype=np.uint8),
+        ]
+        for roi in rois:
+            _, binary = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+            self.assertEqual(image_processor.DocAnalyzer._calculate_ink_density(roi), cv2.countNonZero(binary))
+
+    def test_ink_density_empty_roi(self):
+        """空のROIは0を返すこと"""
+        roi = np.zeros((0, 10), dtype=np.uint8)
+        self.assertEqual(image_processor.DocAnalyzer._calculate_ink_density(roi), 0)
+
+if __name__ == '__main__':
+    unittest.main()
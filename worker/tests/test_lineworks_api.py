@@ -0,0 +1,75 @@
+import unittest
+
+import lineworks_api
+
+class _FakeStreamResponse:
+    """stream=True のレスポンスの代わりに、指定したチャンクを返すテスト用のレスポンス。"""
+    def __init__(self, chunks, headers=None):
+        self._chunks = chunks
+        self.headers = headers or {}
+        self.consumed = 0
+
+    def iter_content(self, chunk_size=None):
+        for chunk in self._chunks:
+            self.consumed += 1
+            yield chunk
+
+class TestReadStreamedContent(unittest.TestCase):
+
+    def test_rejects_declared_oversize_before_reading(self):
+        """Content-Length が上限を超える場合は、本文を読み込まずに中止すること"""
+        response = _FakeStreamResponse([b"a" * 10], {'Content-Length': '11'})
+        with self.assertRaises(lineworks_api.AttachmentTooLargeError):
+            lineworks_api._read_streamed_content(response, 10)
+        self.assertEqual(response.consumed, 0)
+
+    def test_aborts_undeclared_oversize_stream(self):
+        """Content-Length がない場合も、上限を超えた時点で読み込みを打ち切ること"""
+        response = _FakeStreamResponse([b"a" * 4] * 100)
+        with self.assertRaises(lineworks_api.AttachmentTooLargeError):
+            lineworks_api._read_streamed_content(response, 10)
+        self.assertLess(response.consumed, 100)
+
+    def test_aborts_when_body_exceeds_declared_length(self):
+        """申告より大きい本文が上限を超える場合も中止すること"""
+        response = _FakeStreamResponse([b"a" * 4] * 100, {'Content-Length': '8'})
+        with self.assertRaises(lineworks_api.AttachmentTooLargeError):
+            lineworks_api._read_streamed_content(response, 10)
+        self.assertLess(response.consumed, 100)
+
+    def test_reads_body_with_exact_content_length(self):
+        """Content-Length どおりの本文を、チャンクを結合したバイト列として返すこと"""
+        response = _FakeStreamResponse([b"abc", b"def", b"g"], {'Content-Length': '7'})
+        content = lineworks_api._read_streamed_content(response, 100)
+        self.assertEqual(content, b"abcdefg")
+        self.assertIsInstance(content, bytes)
+
+    def test_body_shorter_than_content_length(self):
+        """申告より短い本文は、実際に受信した分だけを返すこと"""
+        response = _FakeStreamResponse([b"abc"], {'Content-Length': '10'})
+        self.assertEqual(lineworks_api._read_streamed_content(response, 100), b"abc")
+
+    def test_body_longer_than_content_length(self):
+        """申告より長い本文も、上限内であれば全て返すこと"""
+        response = _FakeStreamResponse([b"abc", b"def", b"ghi"], {'Content-Length': '4'})
+        self.assertEqual(lineworks_api._read_streamed_content(response, 100), b"abcdefghi")
+
+    def test_body_without_content_length_or_compressed(self):
+        """Content-Length が無い場合や圧縮転送の場合は、追記で全て読み込むこと"""
+        for headers in ({}, {'Content-Length': '3', 'Content-Encoding': 'gzip'}, {'Content-Length': 'abc'}):
+            response = _FakeStreamResponse([b"abc", b"def"], headers)
+            self.assertEqual(lineworks_api._read_streamed_content(response, 100), b"abcdef", headers)
+
+    def test_empty_body(self):
+        """本文が空の場合は空のバイト列を返すこと"""
+        for headers in ({}, {'Content-Length': '0'}):
+            response = _FakeStreamResponse([], headers)
+            self.assertEqual(lineworks_api._read_streamed_content(response, 100), b"")
+
+    def test_accepts_body_at_limit(self):
+        """上限ちょうどの本文は受け付けること"""
+        response = _FakeStreamResponse([b"a" * 5, b"b" * 5], {'Content-Length': '10'})
+        self.assertEqual(lineworks_api._read_streamed_content(response, 10), b"aaaaabbbbb")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+
+import errors
+import logger_config
+
+# インポート時のロギング設定（ルートロガーのハンドラ置き換え）は行わない
+with patch.object(logger_config, 'configure_logging'):
+    import main
+
+class TestWorkerEndpoint(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = main.app.test_client()
+        patcher = patch.object(main.tasks, 'process_image_and_reply')
+        cls.mock_process = patcher.start()
+        cls.addClassCleanup(patcher.stop)
+
+    def setUp(self):
+        self.mock_process.reset_mock(return_value=True, side_effect=True)
+
+    def _post(self, payload):
+        return self.client.post('/worker', json=payload)
+
+    def test_success(self):
+        """処理が成功した場合は200を返し、タスクの情報を渡して処理を呼び出すこと"""
+        response = self._post({'file_id': 'f1', 'user_id': 'u1', 'channel_id': 'c1', 'trace_id': 't1'})
+        self.assertEqual(response.status_code, 200)
+        self.mock_process.assert_called_once_with(file_id='f1', user_id='u1', channel_id='c1', trace_id='t1')
+
+    def test_missing_file_id(self):
+        """file_id が無い場合は処理を呼び出さずに400を返すこと"""
+        response = self._post({'user_id': 'u1'})
+        self.assertEqual(response.status_code, 400)
+        self.mock_process.assert_not_called()
+
+    def test_non_retryable_task_errors_return_200(self):
+        """再試行しても結果が変わらないエラーは200を返し、Cloud Tasksに再試行させないこと"""
+        for error_class in (
+            errors.InvalidFileError,
+            errors.TitleNotRecognizedError,
+            errors.KeywordNotMatchedError,
+            errors.CsvGenerationError,
+            errors.NotifyError,
+        ):
+            self.mock_process.side_effect = error_class("permanent", "message")
+            response = self._post({'file_id': 'f1', 'user_id': 'u1'})
+            self.assertEqual(response.status_code, 200, error_class.__name__)
+
+    def test_retryable_task_errors_return_400(self):
+        """一時的な障害の可能性があるエラーは400を返し、Cloud Tasksに再試行させること"""
+        for error_class in (
+            errors.StoreLookupError,
+            errors.DownloadError,
+            errors.OCRError,
+            errors.UploadError,
+        ):
+            self.mock_process.side_effect = error_class("transient", "message")
+            response = self._post({'file_id': 'f1', 'user_id': 'u1'})
+            self.assertEqual(response.status_code, 400, error_class.__name__)
+
+    def test_unexpected_error_returns_400(self):
+        """TaskError 以外の予期せぬ例外は400を返すこと"""
+        self.mock_process.side_effect = RuntimeError("boom")
+        response = self._post({'file_id': 'f1', 'user_id': 'u1'})
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
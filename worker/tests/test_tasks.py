@@ -1,61 +1,66 @@
 import unittest
 from unittest.mock import patch, MagicMock
-import os
-import sys
+from contextlib import ExitStack
 
-# worker ディレクトリをパスに追加
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# secret_manager は conftest.py でモックに差し替え済みのため、そのままインポートできる
+from tasks import process_image_and_reply, _match_keyword
 
-# ============================================================================
-# 【重要】configのインポート前にsecret_managerをモックする
-# config.pyはトップレベルでget_secretを呼び出すため、インポート前にインターセプトが必要
-# ============================================================================
-mock_secret_manager_module = MagicMock()
-# get_secretがダミー値を返すように設定し、config.pyの初期化エラーを防ぐ
-mock_secret_manager_module.get_secret.return_value = "dummy_secret_value"
-sys.modules['secret_manager'] = mock_secret_manager_module
+# tasks が依存する関数のうち、テストでモックに置き換えるもの（属性名 -> パッチ対象）
+_PATCH_TARGETS = {
+    'get_store_code_by_user': 'lineworks_api.get_store_code_by_user',
+    'download_lw_attachment': 'lineworks_api.download_lw_attachment',
+    'send_lw_message': 'lineworks_api.send_lw_message',
+    'process_image': 'image_processor.process_image',
+    'process_document': 'document_ai_processor.process_document',
+    'parse_document_entities': 'doc_ai_parser.parse_document_entities',
+    'generate_csv_content': 'csv_generator.generate_csv_content',
+    'generate_csv_filename': 'csv_generator.generate_csv_filename',
+    'upload_staging_image': 'gcs_uploader.upload_staging_image',
+    'upload_processed_results': 'gcs_uploader.upload_processed_results',
+    'upload_error_image': 'gcs_uploader.upload_error_image',
+    'upload_to_s3': 's3_uploader.upload_to_s3',
+}
 
-# cv2とnumpyをモックする（ローカル環境依存を排除）
-sys.modules['cv2'] = MagicMock()
-sys.modules['numpy'] = MagicMock()
+class TestTasks(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        関数のパッチ適用をクラスで1回だけ行う。
+        適用したパッチは ExitStack でまとめて管理し、クラスの終了時に元に戻す。
+        """
+        stack = ExitStack()
+        cls.addClassCleanup(stack.close)
 
-# これで安全にtasksをインポートできる
-from tasks import process_image_and_reply
+        cls.mocks = {name: stack.enter_context(patch(target)) for name, target in _PATCH_TARGETS.items()}
+        stack.enter_context(patch('config.KEYWORDS', frozenset(["クレジット支払", "クレジット受入", "現金支払", "現金受入"])))
 
-class TestTasks(unittest.TestCase):
+    def setUp(self):
+        # テスト間で呼び出し履歴・戻り値が残らないよう、共有のモックを初期化する
+        for mock in self.mocks.values():
+            mock.reset_mock(return_value=True, side_effect=True)
 
-    @patch('lineworks_api.get_store_code_by_user')
-    @patch('lineworks_api.download_lw_attachment')
-    @patch('image_processor.process_image')
-    @patch('document_ai_processor.process_document')
-    @patch('doc_ai_parser.parse_document_entities')
-    @patch('csv_generator.generate_csv_content')
-    @patch('csv_generator.generate_csv_filename')
-    @patch('gcs_uploader.upload_processed_results')
-    @patch('gcs_uploader.upload_error_image')
-    @patch('s3_uploader.upload_to_s3')
-    @patch('lineworks_api.send_lw_message')
-    @patch('config.KEYWORDS', ["クレジット支払", "クレジット受入", "現金支払", "現金受入"])
-    def test_process_image_and_reply_success(self, 
-                                            mock_send_lw_message, 
-                                            mock_upload_to_s3, 
-                                            mock_upload_error_image,
-                                            mock_upload_processed_results, 
-                                            mock_generate_csv_filename,
-                                            mock_generate_csv_content, 
-                                            mock_parse_document_entities, 
-                                            mock_process_document, 
-                                            mock_process_image,
-                                            mock_download_lw_attachment, 
-                                            mock_get_store_code_by_user):
+    def test_process_image_and_reply_success(self):
         """
         process_image_and_reply 関数が成功パスを正常に処理することを確認するテスト
         """
-        
+        mock_get_store_code_by_user = self.mocks['get_store_code_by_user']
+        mock_download_lw_attachment = self.mocks['download_lw_attachment']
+        mock_send_lw_message = self.mocks['send_lw_message']
+        mock_process_image = self.mocks['process_image']
+        mock_process_document = self.mocks['process_document']
+        mock_parse_document_entities = self.mocks['parse_document_entities']
+        mock_generate_csv_content = self.mocks['generate_csv_content']
+        mock_generate_csv_filename = self.mocks['generate_csv_filename']
+        mock_upload_staging_image = self.mocks['upload_staging_image']
+        mock_upload_processed_results = self.mocks['upload_processed_results']
+        mock_upload_error_image = self.mocks['upload_error_image']
+        mock_upload_to_s3 = self.mocks['upload_to_s3']
+
         # --- 1. Mockの戻り値を設定 ---
         mock_get_store_code_by_user.return_value = ("STORE001", None)
-        mock_download_lw_attachment.return_value = (b"fake_image_bytes", None)
-        mock_process_image.return_value = b"processed_fake_image_bytes"
+        mock_download_lw_attachment.return_value = (b"\xff\xd8\xfffake_image_bytes", None)
+        mock_process_image.return_value = b"\xff\xd8\xffprocessed_fake_image_bytes"
 
         mock_document = MagicMock()
         mock_process_document.return_value = (mock_document, None)
@@ -66,11 +71,12 @@ class TestTasks(unittest.TestCase):
             'amount': 1000
         }, False, None)
         
-        mock_generate_csv_content.return_value = ("csv_content_string", None)
+        mock_generate_csv_content.return_value = ("csv_content_string".encode('utf-8'), None)
         mock_generate_csv_filename.return_value = "STORE001_現金支払_20251217.csv"
         mock_upload_to_s3.return_value = (None, None)
         mock_send_lw_message.return_value = None
         mock_upload_processed_results.return_value = None
+        mock_upload_staging_image.return_value = ("staging/fake.jpg", None)
 
         # --- 2. テスト実行 ---
         process_image_and_reply("file_id_123", "user_id_456", None, "trace_id_789")
@@ -78,9 +84,13 @@ class TestTasks(unittest.TestCase):
         # --- 3. アサーション（検証） ---
         mock_get_store_code_by_user.assert_called_once_with("user_id_456")
         mock_download_lw_attachment.assert_called_once_with("file_id_123")
-        mock_process_image.assert_called_once_with(b"fake_image_bytes")
-        mock_process_document.assert_called_once_with(b"processed_fake_image_bytes", 'image/jpeg')
+        mock_process_image.assert_called_once_with(b"\xff\xd8\xfffake_image_bytes")
+        mock_process_document.assert_called_once_with(b"\xff\xd8\xffprocessed_fake_image_bytes", 'image/jpeg')
         
+        # 原本画像は一時領域にアップロードされ、成果物の保存時にそのパスが渡されること
+        mock_upload_staging_image.assert_called_once_with(b"\xff\xd8\xfffake_image_bytes")
+        self.assertEqual(mock_upload_processed_results.call_args.kwargs["staged_image_path"], "staging/fake.jpg")
+
         mock_upload_to_s3.assert_called_once_with("csv_content_string".encode('utf-8'), "STORE001_現金支払_20251217.csv")
         
         # 成功メッセージの検証
@@ -95,5 +105,71 @@ class TestTasks(unittest.TestCase):
         # エラー処理が呼ばれていないことを確認
         mock_upload_error_image.assert_not_called()
 
+    def test_match_keyword_exact_and_normalized(self):
+        """完全一致のタイトルと、NFKC正規化で一致するタイトル（半角カナ）はそのキーワードになること"""
+        self.assertEqual(_match_keyword("現金支払"), "現金支払")
+        self.assertEqual(_match_keyword("ｸﾚｼﾞｯﾄ受入"), "クレジット受入")
+
+    def test_match_keyword_close_match(self):
+        """1文字の誤読など、近いキーワードが一意に決まる場合はそのキーワードになること"""
+        self.assertEqual(_match_keyword("現金支払い"), "現金支払")
+        self.assertEqual(_match_keyword("クレジット支拉"), "クレジット支払")
+
+    def test_match_keyword_rejects_exclusive_chars(self):
+        """支払と受入（またはクレジットと現金）の特徴文字を両方含むタイトルは照合しないこと"""
+        self.assertIsNone(_match_keyword("クレジット受払"))
+        self.assertIsNone(_match_keyword("クレジット支入"))
+        self.assertIsNone(_match_keyword("現金クレジット支払"))
+
+    def test_match_keyword_rejects_ambiguous_match(self):
+        """最も近いキーワードが次点と同点・僅差の場合は照合しないこと"""
+        with patch('config.KEYWORDS', frozenset(["出納票A支払", "出納票B支払"])):
+            self.assertIsNone(_match_keyword("出納票C支払"))
+
+    def test_match_keyword_rejects_unrelated_title(self):
+        """空のタイトルや、どのキーワードにも近くないタイトルは None になること"""
+        self.assertIsNone(_match_keyword(""))
+        self.assertIsNone(_match_keyword(None))
+        self.assertIsNone(_match_keyword("領収書"))
+
+    def test_process_image_and_reply_attachment_too_large(self):
+        """上限を超える添付ファイルは再試行しないエラーとなり、画像処理を行わないこと"""
+        from errors import InvalidFileError
+        import lineworks_api
+
+        self.mocks['get_store_code_by_user'].return_value = ("STORE001", None)
+        self.mocks['download_lw_attachment'].side_effect = lineworks_api.AttachmentTooLargeError("too large")
+
+        with self.assertRaises(InvalidFileError) as cm:
+            process_image_and_reply("file_id_123", "user_id_456", None, "trace_id_789")
+
+        self.assertFalse(cm.exception.retryable)
+        self.mocks['process_image'].assert_not_called()
+        self.mocks['upload_staging_image'].assert_not_called()
+
+    def test_process_image_and_reply_keyword_not_matched(self):
+        """キーワードに該当しないタイトルは再試行しないエラーとなり、CSVを作成しないこと"""
+        from errors import KeywordNotMatchedError
+
+        self.mocks['get_store_code_by_user'].return_value = ("STORE001", None)
+        self.mocks['download_lw_attachment'].return_value = (b"\xff\xd8\xfffake_image_bytes", None)
+        self.mocks['process_image'].return_value = b"\xff\xd8\xffprocessed_fake_image_bytes"
+        self.mocks['process_document'].return_value = (MagicMock(), None)
+        self.mocks['parse_document_entities'].return_value = ({'title': 'クレジット受払'}, False, None)
+        self.mocks['upload_staging_image'].return_value = ("staging/fake.jpg", None)
+
+        with self.assertRaises(KeywordNotMatchedError) as cm:
+            process_image_and_reply("file_id_123", "user_id_456", None, "trace_id_789")
+
+        self.assertFalse(cm.exception.retryable)
+        self.mocks['generate_csv_content'].assert_not_called()
+        self.mocks['upload_to_s3'].assert_not_called()
+
+        # 例外が送出される時点で、ユーザーへのエラー通知が送信済みであること
+        self.mocks['send_lw_message'].assert_called_once()
+        args, _ = self.mocks['send_lw_message'].call_args
+        self.assertEqual(args[0], "user_id_456")
+        self.assertEqual(args[1]["content"]["text"], cm.exception.user_facing_message)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import patch
+
+from ttl_cache import TTLCache
+
+class TestTTLCache(unittest.TestCase):
+
+    def setUp(self):
+        # 有効期限の判定に使う時刻をテストから進められるようにする
+        self.now = 1000.0
+        patcher = patch('ttl_cache.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_returns_value_until_expiry(self):
+        """有効期限内は値を返し、期限を過ぎるとdefaultを返してエントリを破棄すること"""
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set('a', 1)
+        self.now += 9.9
+        self.assertEqual(cache.get('a'), 1)
+        self.now += 0.1
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', 'missing'), 'missing')
+        self.assertEqual(len(cache), 0)
+
+    def test_set_overwrites_value_and_expiry(self):
+        """同じキーへの再格納は値と有効期限を更新すること"""
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set('a', 1)
+        self.now += 8
+        cache.set('a', 2)
+        self.now += 8
+        self.assertEqual(cache.get('a'), 2)
+
+    def test_evicts_least_recently_used(self):
+        """最大件数を超えた場合は、最も長く参照されていないエントリから破棄すること"""
+        cache = TTLCache(maxsize=2, ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # 'a' を参照すると 'b' の方が古くなる
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_falsy_values_are_cached(self):
+        """None 以外の偽値（空文字・0）も格納した値として返すこと"""
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set('empty', '')
+        cache.set('zero', 0)
+        self.assertEqual(cache.get('empty', 'missing'), '')
+        self.assertEqual(cache.get('zero', 'missing'), 0)
+
+    def test_clear(self):
+        """clear で全てのエントリを破棄すること"""
+        cache = TTLCache(maxsize=4, ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertNotIn('a', cache)
+
+if __name__ == '__main__':
+    unittest.main()
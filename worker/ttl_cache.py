@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+
+# キャッシュに存在しないことを表す番兵オブジェクト
+_MISSING = object()
+
+class TTLCache:
+    """
+    有効期限(TTL)と最大件数を持つ、スレッドセーフなLRUキャッシュ。
+    最大件数を超えた場合は、最も長く参照されていないエントリから破棄する。
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """有効期限内の値を返す。存在しない、または期限切れの場合はdefaultを返す。"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """値を格納し、最大件数を超えた分を古い順に破棄する。"""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """全てのエントリを破棄する。"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)